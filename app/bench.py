@@ -0,0 +1,187 @@
+"""
+DrawEnglish 성능 측정 스크립트 (서버 코드와 분리)
+    python -m app.bench                  # 전부
+    python -m app.bench render bucketing # 골라서 (tokens / render / pipeline / bucketing)
+app.main을 import하므로 SPACY_MODEL 등 환경 변수는 서버와 똑같이 적용된다.
+"""
+import contextlib, io, gc, sys, time, tracemalloc
+
+from app.main import (
+    ANALYZE_BATCH_SIZE, SPACY_EXCLUDE, nlp, load_spacy_model, pipe_by_length,
+    init_memorys, spacy_parsing_backgpt, apply_symbols, apply_subject_adverb_chunk_range_symbol,
+    draw_dot_bridge_across_verb_group, symbols_to_diagram,
+    doc_to_tokens, token_to_dict, copy_token_table,
+)
+
+
+# 토큰 테이블 메모리 비교 함수 : 예전 dict 방식 vs TokenRecord (tracemalloc 최대 사용량, GC 횟수, 시간)
+# 요청 1건에서 하는 일(파싱 결과 → 토큰 테이블 → 규칙 단계용 복사본)을 문장마다 반복해서 잰다.
+def bench_token_table_memory(sentences: list = None, repeat: int = 20):
+    sentences = sentences or [
+        "Although when he arrived she had already left, I realized that she was serious.",
+        "He told me that she wanted to eat something.",
+        "She painted the wall green.",
+        "I want you to succeed.",
+    ]
+    docs = list(nlp.pipe(sentences))
+
+    def legacy_tables():
+        # 예전 doc_to_tokens + copy_token_table 과 같은 dict 구성
+        for doc in docs:
+            tokens = [dict(token_to_dict(token), dep=token.dep_.lower()) for token in doc]
+            yield [dict(t, morph=dict(t["morph"]), children=list(t["children"])) for t in tokens]
+
+    def record_tables():
+        for doc in docs:
+            yield copy_token_table(doc_to_tokens(doc))
+
+    results = {}
+    for name, build in (("dict", legacy_tables), ("record", record_tables)):
+        gc.collect()
+        gen0_before = gc.get_stats()[0]["collections"]
+        tracemalloc.start()
+        started = time.perf_counter()
+        kept = [list(build()) for _ in range(repeat)]  # 동시에 살아있는 요청들처럼 잡아둠
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            "peak_kb": round(peak / 1024, 1),
+            "gc_gen0": gc.get_stats()[0]["collections"] - gen0_before,
+            "ms": round(elapsed * 1000, 2),
+        }
+        del kept
+
+    for name, r in results.items():
+        print(f"{name:7s} peak={r['peak_kb']:9.1f} KB  gc(gen0)={r['gc_gen0']:4d}  time={r['ms']:8.2f} ms")
+    return results
+
+
+# 도식 그리기 단계(apply_symbols ~ symbols_to_diagram)만 반복 측정. 규칙 분석은 문장마다 1번만 하고 격자만 매번 새로 그린다.
+#   bench_diagram_render()  → 문장(토큰 수)별 1회 평균 μs
+def bench_diagram_render(sentences: list = None, repeat: int = 200):
+    base = [
+        "Although when he arrived she had already left, I realized that she was serious.",
+        "He told me that she wanted to eat something.",
+        "She painted the wall green.",
+    ]
+    sentences = sentences or base + [" ".join(base * 8)]  # 마지막은 문단 길이
+    results = []
+    for sentence in sentences:
+        ctx = init_memorys(sentence)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctx.parsed = spacy_parsing_backgpt(sentence, ctx)
+            after_rules = ctx.symbols_by_level.copy()  # 규칙 단계에서 찍은 덩어리 표시까지
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                ctx.symbols_by_level = after_rules.copy()
+                apply_symbols(ctx.parsed, ctx)
+                apply_subject_adverb_chunk_range_symbol(ctx.parsed, ctx)
+                draw_dot_bridge_across_verb_group(ctx.parsed, ctx)
+                symbols_to_diagram(sentence, ctx)
+            elapsed = time.perf_counter() - started
+
+        results.append({"tokens": len(ctx.parsed), "chars": len(sentence),
+                        "us": round(elapsed / repeat * 1e6, 1)})
+
+    for r in results:
+        print(f"tokens={r['tokens']:5d} chars={r['chars']:6d}  render={r['us']:9.1f} μs")
+    return results
+
+# 컴포넌트별 처리 시간 (예시 문장 묶음 기준). 어느 컴포넌트가 비싼지/프로필에서 더 뺄 게 있는지 볼 때 사용
+#   profile_pipeline()                          # 지금 불러온 SPACY_MODEL (프로필 적용된 상태)
+#   profile_pipeline(model="en_core_web_trf")   # 모든 컴포넌트를 새로 불러와서 비교 (NER 비용 확인)
+def profile_pipeline(sentences: list = None, repeat: int = 3, model=None, batch_size: int = None):
+    pipeline = load_spacy_model(model) if isinstance(model, str) else (model or nlp)
+    base = [
+        "Although when he arrived she had already left, I realized that she was serious.",
+        "He told me that she wanted to eat something.",
+        "She painted the wall green.",
+    ]
+    sentences = sentences or base * 10 + [" ".join(base * 8)]
+    batch_size = batch_size or ANALYZE_BATCH_SIZE
+
+    timings = {"tokenizer": 0.0}
+    timings.update((name, 0.0) for name in pipeline.pipe_names)
+    for _ in range(repeat):
+        started = time.perf_counter()
+        docs = [pipeline.make_doc(s) for s in sentences]
+        timings["tokenizer"] += time.perf_counter() - started
+        for name, proc in pipeline.pipeline:
+            started = time.perf_counter()
+            if hasattr(proc, "pipe"):
+                docs = list(proc.pipe(docs, batch_size=batch_size))
+            else:
+                docs = [proc(doc) for doc in docs]
+            timings[name] += time.perf_counter() - started
+
+    total = sum(timings.values()) or 1.0
+    results = [
+        {"component": name, "ms": round(seconds / repeat * 1000, 3),
+         "ms_per_sentence": round(seconds / repeat / len(sentences) * 1000, 4),
+         "share": round(seconds / total, 4)}
+        for name, seconds in timings.items()
+    ]
+    print(f"model={pipeline.meta.get('name')} sentences={len(sentences)} components={pipeline.pipe_names}")
+    for r in results:
+        print(f"{r['component']:>16s}  {r['ms']:10.3f} ms  {r['ms_per_sentence']:8.4f} ms/sent  {r['share']:6.1%}")
+    return results
+
+
+# 교과서 문장(짧음) 사이에 읽기 지문(문단)이 섞인 말뭉치로 입력 순서 그대로 vs 길이 정렬 nlp.pipe 처리량 비교
+#   bench_length_bucketing()   # SPACY_MODEL, 캐시 안 씀
+def bench_length_bucketing(sentences: list = None, repeat: int = 3, batch_size: int = None, model=None):
+    pipeline = load_spacy_model(model, exclude=SPACY_EXCLUDE) if isinstance(model, str) else (model or nlp)
+    if sentences is None:
+        textbook = [
+            "She painted the wall green.",
+            "He told me that she wanted to eat something.",
+            "They elected him president.",
+            "I want you to succeed.",
+            "Although when he arrived she had already left, I realized that she was serious.",
+            "The book that you gave me yesterday was very interesting.",
+        ]
+        passage = " ".join(textbook * 4)  # 읽기 지문 1개 (약 100 토큰)
+        sentences = []
+        for i in range(8):
+            sentences += textbook + [passage]  # 문장 6개마다 지문 1개
+    batch_size = batch_size or ANALYZE_BATCH_SIZE
+
+    results = {}
+    for name, sort in (("naive", False), ("bucketed", True)):
+        pipe_by_length(pipeline, sentences[:batch_size], batch_size, sort)  # 워밍업
+        started = time.perf_counter()
+        for _ in range(repeat):
+            docs = pipe_by_length(pipeline, sentences, batch_size, sort)
+        elapsed = (time.perf_counter() - started) / repeat
+        results[name] = {"seconds": round(elapsed, 4), "sentences_per_s": round(len(sentences) / elapsed, 1),
+                         "parses": [[(t.tag_, t.dep_, t.head.i) for t in doc] for doc in docs]}
+
+    same = sum(a == b for a, b in zip(results["naive"].pop("parses"), results["bucketed"].pop("parses")))
+    summary = {
+        "sentences": len(sentences),
+        "tokens": sum(len(pipeline.make_doc(s)) for s in sentences),
+        "batch_size": batch_size,
+        **results,
+        "speedup": round(results["naive"]["seconds"] / results["bucketed"]["seconds"], 3),
+        "same_parses": same,
+    }
+    print(f"sentences={summary['sentences']} tokens={summary['tokens']} batch_size={batch_size}")
+    for name in ("naive", "bucketed"):
+        print(f"{name:>9s}  {results[name]['seconds']:8.4f} s  {results[name]['sentences_per_s']:9.1f} sent/s")
+    print(f"speedup x{summary['speedup']}  same parses {same}/{len(sentences)}")
+    return summary
+
+
+BENCHES = {
+    "tokens": bench_token_table_memory,
+    "render": bench_diagram_render,
+    "pipeline": profile_pipeline,
+    "bucketing": bench_length_bucketing,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHES:
+        print(f"◎ {name}")
+        BENCHES[name]()
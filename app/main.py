@@ -1,9 +1,19 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 import os, json, re
+import asyncio, threading, time, hashlib, sqlite3, math
+import contextlib, hmac
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import numpy as np
 import spacy
+from spacy.attrs import POS, TAG, DEP, HEAD, IDX, LEMMA, LOWER
+from spacy.parts_of_speech import IDS as POS_IDS
+from spacy.tokens import Doc, DocBin, Token
+from spacy.matcher import DependencyMatcher, Matcher
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.responses import JSONResponse, FileResponse  # render에 10분 단위 Ping 보내기를 위해 추가
 from pydantic import BaseModel
 # 아래 api_key= 까지는 .env 파일에서 OpenAI키를 불러오기 관련 부분 
@@ -23,13 +33,59 @@ app = FastAPI()  # FastAPI() 객체를 생성해서 이후 라우팅에 사용
 # 환경 변수에서 모델명 가져오기, 없으면 'en_core_web_sm' 기본값
 model_name = os.getenv("SPACY_MODEL", "en_core_web_trf")
 
-try:
-    nlp = spacy.load(model_name)
-except OSError:
-    # 모델이 없으면 다운로드 후 다시 로드
-    from spacy.cli import download
-    download(model_name)
-    nlp = spacy.load(model_name)
+def load_spacy_model(name: str, **kwargs):
+    try:
+        return spacy.load(name, **kwargs)
+    except OSError:
+        # 모델이 없으면 다운로드 후 다시 로드
+        from spacy.cli import download
+        download(name)
+        return spacy.load(name, **kwargs)
+
+
+# 파이프라인 프로필 : 규칙 엔진이 안 쓰는 컴포넌트는 아예 안 불러옴 (exclude → 메모리/추론 시간 모두 절약)
+# - rules : 규칙 엔진에 필요한 것만 (NER 제외 → /parse는 처음 호출될 때 NER 포함 파이프라인을 따로 불러옴)
+# - full  : 모델의 모든 컴포넌트
+# SPACY_EXCLUDE로 더 뺄 컴포넌트를 쉼표로 지정할 수 있음 (뺀 뒤에도 RULE_TOKEN_ATTRS가 나오는지 시작할 때 확인)
+PIPELINE_PROFILES = {
+    "rules": ["ner"],
+    "full": [],
+}
+SPACY_PIPELINE_PROFILE = os.getenv("SPACY_PIPELINE_PROFILE", "rules")
+if SPACY_PIPELINE_PROFILE not in PIPELINE_PROFILES:
+    raise RuntimeError(f"❌ unknown SPACY_PIPELINE_PROFILE: {SPACY_PIPELINE_PROFILE!r} (choose from {sorted(PIPELINE_PROFILES)})")
+SPACY_EXCLUDE = PIPELINE_PROFILES[SPACY_PIPELINE_PROFILE] + [
+    name.strip() for name in os.getenv("SPACY_EXCLUDE", "").split(",") if name.strip()
+]
+
+# 규칙 엔진이 읽는 토큰 속성 (Doc.has_annotation 이름). HEAD는 DEP와 같이 채워짐
+RULE_TOKEN_ATTRS = ("TAG", "POS", "DEP", "LEMMA", "MORPH")
+PIPELINE_PROBE_SENTENCE = "She painted the wall green."
+
+
+def check_pipeline_attributes(pipeline, name: str):
+    """빠진 컴포넌트 때문에 규칙 엔진이 쓰는 속성이 안 채워지면 서버를 띄우지 않는다."""
+    doc = pipeline(PIPELINE_PROBE_SENTENCE)
+    missing = [attr for attr in RULE_TOKEN_ATTRS if not doc.has_annotation(attr)]
+    if missing:
+        raise RuntimeError(
+            f"❌ spaCy pipeline {name!r} (components: {pipeline.pipe_names}, excluded: {SPACY_EXCLUDE}) "
+            f"does not set {missing}; check SPACY_PIPELINE_PROFILE / SPACY_EXCLUDE"
+        )
+
+
+nlp = load_spacy_model(model_name, exclude=SPACY_EXCLUDE)
+check_pipeline_attributes(nlp, model_name)
+
+# 빠른 모델(예: en_core_web_sm)을 지정하면 모든 문장을 이 모델로 먼저 분석하고, 위험 신호가 있는 문장만 SPACY_MODEL로 다시 분석
+# (비워두면 라우팅 없이 SPACY_MODEL만 씀). vocab을 같이 써야 StringStore/Matcher/Token 확장을 두 모델이 공유할 수 있음
+SPACY_FAST_MODEL = os.getenv("SPACY_FAST_MODEL", "")
+nlp_fast = (
+    load_spacy_model(SPACY_FAST_MODEL, vocab=nlp.vocab, exclude=SPACY_EXCLUDE)
+    if SPACY_FAST_MODEL and SPACY_FAST_MODEL != model_name else None
+)
+if nlp_fast is not None:
+    check_pipeline_attributes(nlp_fast, SPACY_FAST_MODEL)
 
 # ◎ 심볼 매핑
 role_to_symbol = {
@@ -83,11 +139,25 @@ symbols_all = {
     "relatives": relative_words_symbol
 }
 
-# ◎ 메모리 구조 / 메모리 초기화화
-memory = {
-    "symbols_by_level": {},
-    "symbols_all": symbols_all
-}
+# ◎ 요청별 분석 컨텍스트 (예전 전역 memory dict 대체)
+class AnalysisContext:
+    """
+    /analyze 요청 1건 동안만 사용하는 분석 상태 저장공간.
+    예전 전역 memory dict를 대신하며, 파이프라인의 각 단계에 인자로 넘겨준다.
+    요청끼리 공유하는 가변 상태가 없으므로 여러 스레드/워커에서 동시에 분석해도 도식이 섞이지 않는다.
+    """
+    def __init__(self, sentence: str, symbols: "SymbolTable" = None):
+        self.sentence = sentence
+        self.sentence_length = len(sentence)  # 도식 길이 추적용 (줄 길이 통일)
+        self.symbols_by_level = DiagramGrid(len(sentence))  # level별 심볼 줄 (문장마다 새로 생성)
+        self.symbols = symbols or default_symbols  # 이 요청에 쓸 심볼 세트 (컴파일된 SymbolTable)
+        self.symbols_all = self.symbols.categories
+        self.parsed = None
+        self.index = None                     # TokenIndex (spaCy 파싱 후 1번 생성)
+        self.doc = None                       # 이번 분석에 쓴 spaCy Doc (캐시된 토큰 테이블로 분석하면 None)
+        self.verb_attribute = {}
+        self.verb_attribute_by_chain = []
+        self.used_gpt = False                 # GPT fallback 사용 여부
 
 
 # level 발생 트리거 dep 목록 (전역으로 통일)
@@ -102,79 +172,702 @@ all_nouchunk_types = {
     "subclause_noun", "to.R_noun", "R.ing_ger_noun"
 }
 
-# 📘 보어가 **명사만** 가능한 SVOC 동사
-SVOC_noun_only = {
-    "name", "appoint", "elect", "dub", "label", "christen", "nominate"
-}
-
-# 📙 보어가 **형용사만** 가능한 SVOC 동사
-SVOC_adj_only = {
-    "find", "keep", "leave", "consider"  # 일부 보어 명사도 가능하긴 하지만 거의 형용사 우위
-}
-
-# 📗 보어가 **명사/형용사 둘 다** 가능한 SVOC 동사
-SVOC_both = {
-    "make", "call", "consider", "declare", "paint", "think", "judge"
-}
+# ◎ 어휘 사전 : Grammar/lexicons_v1.json (LEXICON_PATH로 변경 가능)에서 읽어서
+#    단어 → 사전 bitflag 표로 1번만 컴파일한다. 토큰마다 flag는 TokenIndex를 만들 때 1번만 계산하고 규칙은 bit만 검사.
+#    사전마다 비교 기준(match)이 다르다: lemma(원형 그대로) / lemma_lower(조동사) / text_lower(blacklist 전치사)
+LEXICON_PATH = os.getenv(
+    "LEXICON_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "Grammar", "lexicons_v1.json")),
+)
+
+# 규칙 코드가 쓰는 사전 이름 (순서 = bit 위치). 사전 파일에는 이 이름들이 모두 있어야 한다.
+LEXICON_NAMES = [
+    "SVOC_noun_only",            # 📘 보어가 **명사만** 가능한 SVOC 동사
+    "SVOC_adj_only",             # 📙 보어가 **형용사만** 가능한 SVOC 동사
+    "SVOC_both",                 # 📗 보어가 **명사/형용사 둘 다** 가능한 SVOC 동사
+    "noSubjectComplementVerbs",
+    "noObjectVerbs",
+    "modalVerbs_present",
+    "modalVerbs_past",
+    "beVerbs",
+    "notbeLinkingVerbs_onlySVC",
+    "notbeLinkingVerbs_SVCSVO",
+    "dativeVerbs",
+    "blacklist_preposition_words",  # spaCy가 전치사로 오인 태깅하는 특수 단어들
+]
+LEX = {name: 1 << i for i, name in enumerate(LEXICON_NAMES)}
+LEXICON_MATCH_KINDS = ("lemma", "lemma_lower", "text_lower")
 
-noSubjectComplementVerbs = {
-    "live", "arrive", "go", "come", "sleep", "die", "run", "walk", "travel", "exist", "happen"
-}
 
-noObjectVerbs = {
-    "die", "arrive", "exist", "go", "come", "vanish", "fall", "sleep", "occur"
-}
+class Lexicon:
+    """
+    버전 있는 사전 파일 1개를 컴파일한 결과 (만든 뒤엔 바꾸지 않음)
+    - sets  : 사전 이름 → 단어 frozenset
+    - flags : match 종류 → {단어: 사전 bitflag}
+    """
+    def __init__(self, data: dict, source: str = None):
+        if not isinstance(data, dict):
+            raise ValueError(f"lexicon file {source!r}: top level must be a JSON object")
+        self.version = data.get("version")
+        self.source = source
+        lexicons = data.get("lexicons") or {}
+        if not isinstance(lexicons, dict):
+            raise ValueError(f"lexicon file {source!r}: 'lexicons' must be an object")
+        missing = [name for name in LEXICON_NAMES if name not in lexicons]
+        if missing:
+            raise ValueError(f"lexicon file {source!r} is missing: {', '.join(missing)}")
+
+        self.sets = {}
+        self.match = {}
+        self.flags = {kind: {} for kind in LEXICON_MATCH_KINDS}
+        self._word_ids = {}  # 사전 이름 → 문자열 id 배열 (word_ids, 처음 쓸 때 생성)
+        for name in LEXICON_NAMES:
+            entry = lexicons[name]
+            if not isinstance(entry, dict):
+                raise ValueError(f"lexicon {name!r}: entry must be an object with match/words")
+            kind = entry.get("match", "lemma")
+            if kind not in LEXICON_MATCH_KINDS:
+                raise ValueError(f"lexicon {name!r}: unknown match {kind!r}")
+            words = entry.get("words") or []
+            # 문자열 1개("due")를 그대로 받으면 글자 집합 {d, u, e}가 되므로 목록만 허용
+            if not isinstance(words, list) or not all(isinstance(w, str) for w in words):
+                raise ValueError(f"lexicon {name!r}: words must be a list of strings")
+            words = frozenset(words)
+            self.sets[name] = words
+            self.match[name] = kind
+            table = self.flags[kind]
+            for word in words:
+                table[word] = table.get(word, 0) | LEX[name]
+
+    @classmethod
+    def load(cls, path: str) -> "Lexicon":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), source=path)
+
+    def flags_of(self, token) -> int:
+        """토큰 1개의 사전 bitflag"""
+        lemma = token.get("lemma") or ""
+        return (
+            self.flags["lemma"].get(lemma, 0)
+            | self.flags["lemma_lower"].get(lemma.lower(), 0)
+            | self.flags["text_lower"].get(token["text"].lower(), 0)
+        )
 
-modalVerbs_present = {"will", "shall", "can", "may", "must"}
-modalVerbs_past = {"would", "should", "could", "might"}
+    def words(self, name: str) -> frozenset:
+        return self.sets[name]
+
+    def word_ids(self, name: str) -> np.ndarray:
+        """사전 단어들의 문자열 id 배열 (열 방식 엔진용). 사전은 안 바뀌므로 이름별로 1번만 만든다"""
+        ids = self._word_ids.get(name)
+        if ids is None:
+            ids = self._word_ids[name] = intern_ids(sorted(self.sets[name]))
+        return ids
+
+    @staticmethod
+    def lookup_keys(token) -> tuple:
+        """토큰이 사전과 비교되는 값들 ("match종류:단어"). 결과 캐시 무효화 판단에 사용"""
+        lemma = token.get("lemma") or ""
+        return ("lemma:" + lemma, "lemma_lower:" + lemma.lower(), "text_lower:" + token["text"].lower())
+
+    def changed_keys(self, other: "Lexicon") -> set:
+        """두 사전 사이에 들어오거나 빠진 단어들 ("match종류:단어")"""
+        changed = set()
+        for name in LEXICON_NAMES:
+            old_kind, new_kind = self.match[name], other.match[name]
+            old_words, new_words = self.sets[name], other.sets[name]
+            if old_kind == new_kind:
+                changed.update(f"{old_kind}:{w}" for w in old_words ^ new_words)
+            else:
+                changed.update(f"{old_kind}:{w}" for w in old_words)
+                changed.update(f"{new_kind}:{w}" for w in new_words)
+        return changed
+
+    def to_data(self) -> dict:
+        return {
+            "version": self.version,
+            "lexicons": {
+                name: {"match": self.match[name], "words": sorted(self.sets[name])}
+                for name in LEXICON_NAMES
+            },
+        }
+
+
+lexicon = Lexicon.load(LEXICON_PATH)  # 실행 중 교체는 swap_lexicon() (파일 감시 / POST /admin/lexicon)
+
+# 예전 이름 그대로 쓸 수 있도록 (외부 코드용, swap_lexicon()이 같이 바꿔줌)
+SVOC_noun_only = lexicon.words("SVOC_noun_only")
+SVOC_adj_only = lexicon.words("SVOC_adj_only")
+SVOC_both = lexicon.words("SVOC_both")
+noSubjectComplementVerbs = lexicon.words("noSubjectComplementVerbs")
+noObjectVerbs = lexicon.words("noObjectVerbs")
+modalVerbs_present = lexicon.words("modalVerbs_present")
+modalVerbs_past = lexicon.words("modalVerbs_past")
 modalVerbs_all = modalVerbs_present | modalVerbs_past
-
-beVerbs = {"be", "am", "are", "is", "was", "were", "been", "being"}
-
-notbeLinkingVerbs_onlySVC = {
-    "become", "come", "go", "fall", "sound", "look", "smell", "taste", "seem"
-}
-notbeLinkingVerbs_SVCSVO = {
-    "get", "turn", "grow", "feel"
-}
+beVerbs = lexicon.words("beVerbs")
+notbeLinkingVerbs_onlySVC = lexicon.words("notbeLinkingVerbs_onlySVC")
+notbeLinkingVerbs_SVCSVO = lexicon.words("notbeLinkingVerbs_SVCSVO")
 netbeLinkingVerbs_all = notbeLinkingVerbs_SVCSVO | notbeLinkingVerbs_onlySVC
+dativeVerbs = lexicon.words("dativeVerbs")
+blacklist_preposition_words = lexicon.words("blacklist_preposition_words")
 
-dativeVerbs = {
-    "give", "send", "offer", "show", "lend", "teach", "tell", "write", "read", "promise",
-    "sell", "pay", "pass", "bring", "buy", "ask", "award", "grant", "feed", "hand", "leave", "save", 
-    "bring", "bake", "build", "cook", "sing", "make"  # dative verb로 사용 드문 것들
-}
-
-
-# spaCy가 전치사로 오인 태깅하는 특수 단어들
-blacklist_preposition_words = {"due", "according"}
+# 규칙에서 사용하는 어휘 사전 목록 (캐시 fingerprint 계산용)
+LEXICONS = lexicon.sets
 
 
 # ◎ 요청/응답 목록
 class AnalyzeRequest(BaseModel):   # 사용자가 보낼 요청(sentence) 정의
     sentence: str
+    symbol_set: Optional[str] = None   # 클라이언트별 심볼 세트 이름 (SYMBOL_SETS_PATH, 없으면 default)
 
 class AnalyzeResponse(BaseModel):  # 응답으로 돌려줄 데이터(sentence, diagramming) 정의
     sentence: str
     diagramming: str               # "     ○______□__[         "
     verb_attribute: dict
+    tier: Optional[str] = None     # 응답한 품질 단계 : full / light(빠른 모델만) / cache (AdmissionController 참고)
+
+class BatchAnalyzeRequest(BaseModel):  # 여러 문장 한번에 분석 요청
+    sentences: List[str]
+    batch_size: Optional[int] = None    # nlp.pipe batch_size (없으면 ANALYZE_BATCH_SIZE)
+    symbol_set: Optional[str] = None    # 클라이언트별 심볼 세트 이름
+
+class BatchAnalyzeItem(BaseModel):     # 문장별 결과 (실패한 문장은 error만 채움)
+    sentence: str
+    diagramming: Optional[str] = None
+    verb_attribute: Optional[dict] = None
+    tier: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchAnalyzeResponse(BaseModel):
+    results: List[BatchAnalyzeItem]    # 요청 sentences와 같은 순서
+
+class AnalyzeV2Request(AnalyzeRequest):   # /v2 : 도식을 span 목록으로 받음
+    render: bool = False                  # True면 예전 글자 도식(diagramming)도 같이
+
+class AnalyzeV2Response(BaseModel):
+    sentence: str
+    diagram: dict                         # {"width", "levels", "tense", "spans"} (render_diagram() 참고)
+    verb_attribute: dict
+    model: Optional[str] = None           # 파싱한 spaCy 모델 (SPACY_FAST_MODEL 라우팅시 어느 쪽으로 끝났는지)
+    tier: Optional[str] = None            # full / light / cache
+    diagramming: Optional[str] = None     # render=True 일 때만
+
+class BatchAnalyzeV2Request(BatchAnalyzeRequest):
+    render: bool = False
+
+class BatchAnalyzeV2Item(BaseModel):
+    sentence: str
+    diagram: Optional[dict] = None
+    verb_attribute: Optional[dict] = None
+    model: Optional[str] = None
+    tier: Optional[str] = None
+    diagramming: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchAnalyzeV2Response(BaseModel):
+    results: List[BatchAnalyzeV2Item]
+
+class LexiconUpdateRequest(BaseModel):  # 사전 교체 요청 (lexicons 없으면 사전 파일 다시 읽기)
+    version: Optional[int] = None
+    lexicons: Optional[dict] = None    # {"dativeVerbs": {"match": "lemma", "words": [...]}, ...} 보낸 사전만 바뀜
 
 class ParseRequest(BaseModel):     # spaCy 관련 설정
     text: str
 
 
+# ◎ 토큰 조회용 인덱스 : 규칙 함수마다 next(...)로 전체 토큰을 훑던 것을 dict 조회로 대체
+class TokenIndex:
+    """
+    문장 1개의 토큰 인덱스. 파싱 직후 1번만 만들어서 모든 규칙 단계가 같이 쓴다.
+    - by_idx   : idx(글자 위치) → 토큰
+    - children : head_idx → 자식 토큰 목록 (문장 순서. ROOT는 head가 자기 자신이라 자기도 포함됨 — 예전 선형 탐색과 동일)
+    - position : idx → 문장 안에서의 순번(0부터). 토큰은 idx 오름차순이라 "idx가 x보다 큰 토큰"은 tokens[position[x]+1:]
+    규칙 단계는 role/level/combine만 바꾸고 idx/head_idx는 바꾸지 않으므로 인덱스를 다시 만들 필요가 없다.
+    """
+    def __init__(self, tokens: list):
+        self.tokens = tokens = tokens or []
+        self.features = None  # SentenceFeatures (보정 단계 실행 여부 판단용, 처음 쓸 때 생성)
+        self.matches = None   # RuleMatches (RULE_MATCHER_ENGINE=1 일 때 spacy_parsing_backgpt가 채움)
+        self.lexicon = lexicon  # 이 문장은 끝까지 같은 사전으로 분석
+        self.by_idx = {}
+        self.children = {}
+        self.position = {}
+        self.lex = {}         # idx → 사전 bitflag (LEX)
+        for i, t in enumerate(tokens):
+            self.by_idx[t["idx"]] = t
+            self.position[t["idx"]] = i
+            self.children.setdefault(t["head_idx"], []).append(t)
+            self.lex[t["idx"]] = self.lexicon.flags_of(t)
+
+    def get(self, idx):
+        return self.by_idx.get(idx)
+
+    def lex_of(self, token) -> int:
+        """토큰의 사전 bitflag (이 인덱스에 없는 토큰이면 그 자리에서 계산)"""
+        flags = self.lex.get(token["idx"])
+        return self.lexicon.flags_of(token) if flags is None else flags
+
+    def children_of(self, idx) -> list:
+        return self.children.get(idx, [])
+
+    def after(self, idx) -> list:
+        """idx 보다 뒤에 있는 토큰들 (문장 순서)"""
+        return self.tokens[self.position[idx] + 1:]
+
+    def starting_at(self, idx) -> list:
+        """idx 토큰부터 문장 끝까지"""
+        return self.tokens[self.position[idx]:]
+
+    def between(self, start_idx, end_idx) -> list:
+        """start_idx ~ end_idx 범위(양끝 포함)의 토큰들. 두 값 모두 실제 토큰 idx여야 함"""
+        return self.tokens[self.position[start_idx]:self.position[end_idx] + 1]
+
+    def child_span(self, idx) -> tuple:
+        """토큰 자신 + 직계 자식들이 차지하는 구간 (시작 idx, 끝 idx). 자식 목록이 문장 순서라 O(1)"""
+        children = self.children_of(idx)
+        if not children:
+            return idx, idx
+        return min(idx, children[0]["idx"]), max(idx, children[-1]["idx"])
+
+
+# ◎ 보정 단계 등록부 : 단계마다 "문장에 이런 특징이 있어야만 바뀌는 게 생긴다"는 조건(trigger)을 선언해두고,
+#    문장 특징 bitmap으로 조건이 안 맞는 단계는 실행하지 않는다. 단계별 실행/건너뜀 횟수와 시간은 /stats에서 확인.
+#    trigger는 AND로 묶인 절(clause)들의 목록이고, 절 하나는 OR로 묶인 특징 집합이다.
+#      - "dep:ccomp", "pos:ADJ", "tag:TO" : 문장에 그런 토큰이 있음
+#      - "lex:SVOC_both" : 그 사전에 든 단어가 있음 (TokenIndex의 사전 bitflag 기준)
+#      - "role:indirect object" : 단계 실행 직전 role1 값 중에 있음 (앞 단계들이 role을 바꾸므로 그때그때 계산)
+RULE_PASS_TRIGGERS = os.getenv("RULE_PASS_TRIGGERS", "1") == "1"  # 0이면 조건과 상관없이 모든 단계 실행 (비교/디버깅용)
+
+
+class SentenceFeatures:
+    """문장 1개의 특징 bitmap (dep/pos/tag/사전은 1번만 계산, role은 필요할 때마다 다시 계산)"""
+    def __init__(self, registry: "RulePassRegistry", tokens: list, index: "TokenIndex"):
+        self.registry = registry
+        self.tokens = tokens
+        bit = registry.bit
+        bits = 0
+        lex_flags = 0
+        for t in tokens:
+            bits |= bit("dep:" + (t.get("dep") or "")) | bit("pos:" + (t.get("pos") or "")) | bit("tag:" + (t.get("tag") or ""))
+            lex_flags |= index.lex_of(t)
+        for name in registry.lexicons_used:
+            if lex_flags & LEX[name]:
+                bits |= bit("lex:" + name)
+        self.static_bits = bits
+
+    def role_bits(self) -> int:
+        bit = self.registry.bit
+        bits = 0
+        for role in {t.get("role1") for t in self.tokens}:
+            if role:
+                bits |= bit("role:" + role)
+        return bits
+
+
+class RulePass:
+    def __init__(self, name: str, func, triggers: list):
+        self.name = name
+        self.func = func
+        self.triggers = [set(clause) for clause in (triggers or [])]
+        self.static_masks = None  # role 특징이 없는 절들의 bit mask (처음 판단할 때 계산)
+        self.role_masks = None
+        self.runs = 0
+        self.skipped = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class RulePassRegistry:
+    def __init__(self):
+        self.passes = {}        # func → RulePass (등록 순서 = 파이프라인 순서)
+        self.lexicons_used = []
+        self._bits = {}
+        self._lock = threading.Lock()
+
+    def bit(self, feature: str) -> int:
+        b = self._bits.get(feature)
+        if b is None:
+            with self._lock:
+                b = self._bits.setdefault(feature, 1 << len(self._bits))
+        return b
+
+    def register(self, triggers: list = None, name: str = None):
+        """보정 함수에 붙이는 decorator. 함수는 그대로 돌려주므로 직접 호출도 가능"""
+        def decorator(func):
+            rule_pass = RulePass(name or func.__name__, func, triggers)
+            for clause in rule_pass.triggers:
+                for feature in clause:
+                    if feature.startswith("lex:") and feature[4:] not in self.lexicons_used:
+                        self.lexicons_used.append(feature[4:])
+            self.passes[func] = rule_pass
+            return func
+        return decorator
+
+    def _masks(self, rule_pass: RulePass):
+        if rule_pass.static_masks is None:
+            static_masks, role_masks = [], []
+            for clause in rule_pass.triggers:
+                mask = 0
+                for feature in clause:
+                    mask |= self.bit(feature)
+                is_role = any(feature.startswith("role:") for feature in clause)
+                (role_masks if is_role else static_masks).append(mask)
+            rule_pass.static_masks, rule_pass.role_masks = static_masks, role_masks
+        return rule_pass.static_masks, rule_pass.role_masks
+
+    def should_run(self, rule_pass: RulePass, parsed: list, index: TokenIndex) -> bool:
+        if not RULE_PASS_TRIGGERS or not rule_pass.triggers:
+            return True
+        if index.features is None:
+            index.features = SentenceFeatures(self, parsed, index)
+        features = index.features
+        static_masks, role_masks = self._masks(rule_pass)
+        if not all(mask & features.static_bits for mask in static_masks):
+            return False
+        if role_masks:
+            role_bits = features.role_bits()
+            return all(mask & role_bits for mask in role_masks)
+        return True
+
+    def run(self, func, parsed: list, index: TokenIndex, *args):
+        """등록된 보정 단계를 조건이 맞을 때만 실행 (안 맞으면 parsed를 그대로 돌려줌)"""
+        rule_pass = self.passes[func]
+        if not self.should_run(rule_pass, parsed, index):
+            with self._lock:
+                rule_pass.skipped += 1
+            return parsed
+
+        started = time.perf_counter()
+        result = func(parsed, index, *args)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            rule_pass.runs += 1
+            rule_pass.total_ms += elapsed_ms
+            rule_pass.max_ms = max(rule_pass.max_ms, elapsed_ms)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "triggers_enabled": RULE_PASS_TRIGGERS,
+                "passes": {
+                    p.name: {
+                        "runs": p.runs,
+                        "skipped": p.skipped,
+                        "skip_rate": round(p.skipped / (p.runs + p.skipped), 3) if p.runs + p.skipped else 0.0,
+                        "total_ms": round(p.total_ms, 3),
+                        "avg_ms": round(p.total_ms / p.runs, 4) if p.runs else 0.0,
+                        "max_ms": round(p.max_ms, 3),
+                    }
+                    for p in self.passes.values()
+                },
+            }
+
+
+rule_passes = RulePassRegistry()
+
+
+
+# ◎ 열(column) 방식 토큰 테이블 : 토큰마다 dict를 훑는 대신 문장 전체를 NumPy 배열 몇 개로 들고 조건을 mask로 계산
+#    TOKEN_TABLE_ENGINE=columnar 일 때만 사용 (기본 dict). 결과는 토큰 dict에 다시 써서 이후 단계는 그대로 동작한다.
+TOKEN_TABLE_ENGINE = os.getenv("TOKEN_TABLE_ENGINE", "dict").lower()
+
+# role1 문자열 ↔ 코드 (0 = role 없음)
+ROLE_NAMES = [
+    None,
+    "subject",
+    "verb",
+    "indirect object",
+    "direct object",
+    "object",
+    "preposition",
+    "prepositional object",
+    "conjunction",
+    "noun subject complement",
+    "adjective subject complement",
+    "noun object complement",
+    "adjective object complement",
+]
+ROLE_CODES = {name: code for code, name in enumerate(ROLE_NAMES)}
+
+
+def intern_str(text: str) -> int:
+    """doc.to_array()가 돌려주는 것과 같은 문자열 id (vocab.strings hash / symbol id)"""
+    return nlp.vocab.strings[text or ""]
+
+
+def intern_ids(words) -> np.ndarray:
+    return np.array([intern_str(w) for w in words], dtype=np.uint64)
+
+
+def pos_ids(tags) -> np.ndarray:
+    return np.array([POS_IDS.get(p, 0) for p in tags], dtype=np.uint64)
+
+
+# 규칙에 쓰는 고정 라벨 묶음(dep/pos)의 id 배열은 문장마다 다시 만들지 않고 재사용 (사전 단어는 Lexicon.word_ids)
+_label_id_cache = {}
+
+
+def label_ids(words, pos: bool = False) -> np.ndarray:
+    key = (pos, frozenset(words))
+    ids = _label_id_cache.get(key)
+    if ids is None:
+        ids = pos_ids(sorted(words)) if pos else intern_ids(sorted(words))
+        _label_id_cache[key] = ids
+    return ids
+
+
+def ids_in(values: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    return values == ids[0] if len(ids) == 1 else np.isin(values, ids)
+
+
+class TokenColumns:
+    """
+    문장 1개의 열 방식 토큰 테이블. 모든 배열은 길이 = 토큰 수, 위치 = 문장 안 순번.
+    - pos : spaCy 품사 id / tag, dep, lemma, lower : 문자열 id (dep은 doc_to_tokens처럼 소문자)
+    - head : head 토큰 순번 / idx : 글자 위치
+    - level : float (None은 NaN) / role : ROLE_NAMES 코드
+    """
+    ATTRS = [POS, TAG, DEP, HEAD, IDX, LEMMA, LOWER]
+
+    def __init__(self, pos, tag, dep, head, idx, lemma, lower):
+        self.lexicon = lexicon  # 이 문장을 분석하는 동안 쓸 사전
+        self.pos, self.tag, self.dep, self.lemma, self.lower = pos, tag, dep, lemma, lower
+        self.head = head
+        self.idx = idx
+        self.n = len(idx)
+        self.level = np.full(self.n, np.nan)
+        self.role = np.zeros(self.n, dtype=np.int8)
+
+    @classmethod
+    def from_doc(cls, doc):
+        """doc.to_array() 1번 호출로 생성"""
+        arr = doc.to_array(cls.ATTRS)
+        n = len(arr)
+        dep = arr[:, 2].copy()
+        for dep_id in np.unique(dep):  # ROOT → root (문장당 dep 종류는 10개 남짓)
+            lowered = intern_str(nlp.vocab.strings[int(dep_id)].lower())
+            if lowered != dep_id:
+                dep[dep == dep_id] = lowered
+        head = np.arange(n, dtype=np.int64) + arr[:, 3].astype(np.int64)  # HEAD는 상대 위치
+        return cls(arr[:, 0], arr[:, 1], dep, head, arr[:, 4].astype(np.int64), arr[:, 5], arr[:, 6])
+
+    @classmethod
+    def from_tokens(cls, tokens: list, index: TokenIndex):
+        """캐시된 토큰 테이블(dict 목록)에서 생성 (Doc이 없을 때)"""
+        return cls(
+            pos_ids([t["pos"] for t in tokens]),
+            intern_ids([t["tag"] for t in tokens]),
+            intern_ids([t["dep"] for t in tokens]),
+            np.array([index.position[t["head_idx"]] for t in tokens], dtype=np.int64),
+            np.array([t["idx"] for t in tokens], dtype=np.int64),
+            intern_ids([t["lemma"] for t in tokens]),
+            intern_ids([t["text"].lower() for t in tokens]),
+        )
+
+    def dep_in(self, labels) -> np.ndarray:
+        return ids_in(self.dep, label_ids(labels))
+
+    def pos_in(self, tags) -> np.ndarray:
+        return ids_in(self.pos, label_ids(tags, pos=True))
+
+    def has_child(self, mask: np.ndarray) -> np.ndarray:
+        """mask를 만족하는 자식이 하나라도 있는 토큰 (ROOT는 자기 자신도 자식 — TokenIndex와 동일)"""
+        found = np.zeros(self.n, dtype=bool)
+        found[self.head[mask]] = True
+        return found
+
+
+# guess_role()을 문장 전체에 한번에 적용한 것과 같은 결과를 mask로 계산
+# (규칙 순서대로 아직 결정 안 된 토큰에만 적용. rule_based_parse 시점처럼 head가 뒤에 있으면 head의 role은 아직 없음)
+def guess_roles_columnar(cols: TokenColumns) -> np.ndarray:
+    n = cols.n
+    role = np.zeros(n, dtype=np.int8)
+    decided = np.zeros(n, dtype=bool)
+    head = cols.head
+    positions = np.arange(n)
+    head_before = head < positions
+
+    def decide(mask, role_name):
+        mask = mask & ~decided
+        role[mask] = ROLE_CODES[role_name]
+        decided[mask] = True
+
+    # ✅ Subject
+    decide(cols.dep_in(["nsubj", "nsubjpass"]), "subject")
+
+    # ✅ Main Verb: be동사 포함, 종속절도 고려
+    decide(cols.pos_in(["VERB", "AUX"]) & cols.dep_in(list(level_trigger_deps) + ["root"]), "verb")
+
+    # ✅ 등위접속사 다음 병렬 동사 (conj) : head의 role이 먼저 정해져야 해서 후보만 순서대로 확인
+    for p in np.flatnonzero(cols.pos_in(["VERB"]) & cols.dep_in(["conj"]) & ~decided):
+        if head_before[p] and role[head[p]] == ROLE_CODES["verb"]:
+            role[p] = ROLE_CODES["verb"]
+            decided[p] = True
+
+    # ✅ Indirect Object
+    decide(cols.dep_in(["iobj", "dative"]), "indirect object")
+
+    # ✅ Direct Object (목적어 금지 동사 → role 없음, 같은 head 아래 iobj/dative가 있으면 direct object)
+    is_obj = cols.dep_in(["dobj", "obj"])
+    blocked = is_obj & ids_in(cols.lemma[head], cols.lexicon.word_ids("noObjectVerbs"))
+    decide(blocked, None)
+    has_dative_sibling = cols.has_child(cols.dep_in(["iobj", "dative"]))[head]
+    decide(is_obj & has_dative_sibling, "direct object")
+    decide(is_obj, "object")
+
+    # ✅ Preposition: 기본 prep, agent + 보완 (pcomp), 단 blacklist 단어는 제외
+    is_blacklist = ids_in(cols.lower, cols.lexicon.word_ids("blacklist_preposition_words"))
+    is_prep = (
+        cols.dep_in(["prep", "agent"])
+        | (cols.dep_in(["pcomp"]) & cols.pos_in(["ADP"]) & (cols.tag == intern_str("IN")))
+    ) & ~is_blacklist
+    decide(is_prep, "preposition")
+
+    # ✅ Prepositional Object (blacklist 단어 뒤의 pobj 포함)
+    head_is_prep = head_before & (role[head] == ROLE_CODES["preposition"])
+    head_is_blacklist_prep = is_blacklist[head] & (
+        cols.pos_in(["ADP"])[head] | cols.dep_in(["prep"])[head] | (cols.tag[head] == intern_str("IN"))
+    )
+    decide(cols.dep_in(["pobj"]) & (head_is_prep | head_is_blacklist_prep), "prepositional object")
+
+    # ✅ Conjunction or Clause Marker (접속사)
+    decide(cols.dep_in(["cc", "mark"]) | cols.pos_in(["CCONJ", "CONJ", "SCONJ"]), "conjunction")
+
+    # ✅ Subject Complement (보어 불가 동사 → role 없음)
+    is_attr = cols.dep_in(["attr", "acomp"])
+    decide(is_attr & ids_in(cols.lemma[head], cols.lexicon.word_ids("noSubjectComplementVerbs")), None)
+    is_noun = cols.pos_in(["NOUN", "PROPN", "PRON"])
+    is_adj = cols.pos_in(["ADJ"])
+    decide(is_attr & is_noun, "noun subject complement")
+    decide(is_attr & is_adj, "adjective subject complement")
+
+    # ✅ Object Complement (정상 케이스: dep=oprd, xcomp)
+    is_oprd = cols.dep_in(["oprd", "xcomp", "ccomp"])
+    decide(is_oprd & is_noun, "noun object complement")
+    decide(is_oprd & is_adj, "adjective object complement")
+
+    # ✅ Object Complement (보완 케이스: dep=advmod, pos=ADJ, head=VERB, dobj 존재 시)
+    head_has_obj = cols.has_child(is_obj)[head]
+    decide(
+        cols.dep_in(["advmod"]) & is_adj & cols.pos_in(["VERB"])[head] & head_has_obj,
+        "adjective object complement",
+    )
+
+    cols.role = role
+    return role
+
+
+# ◎ spaCy Matcher 엔진 : 구조 규칙 몇 개를 DependencyMatcher/Matcher 패턴으로 1번 컴파일해두고,
+#    문장마다 matcher를 1번 돌린 결과(토큰 순번 묶음)에 role만 고친다. 그래프 탐색은 spaCy(Cython)가 한다.
+#    RULE_MATCHER_ENGINE=1 일 때만 사용 (기본은 기존 Python 반복문). 두 방식의 결과는 같다.
+#    사전 조건은 후보를 줄이려고 패턴에도 넣지만 판정은 TokenIndex의 사전 bitflag로 다시 한다
+#    (lemma_lower처럼 패턴 속성으로 못 옮기는 match 종류가 있고, 문장마다 고정된 사전을 써야 하므로).
+RULE_MATCHER_ENGINE = os.getenv("RULE_MATCHER_ENGINE", "0") == "1"
+
+LEXICON_MATCH_ATTRS = {"lemma": "LEMMA", "text_lower": "LOWER"}  # 패턴 속성으로 그대로 옮길 수 있는 match 종류
+SVOC_NOUN_COMPLEMENT_DEPS = ["nsubj", "nmod", "attr", "appos", "npadvmod", "ccomp"]
+
+
+def lexicon_pattern(lex: Lexicon, *names) -> dict:
+    """사전 조건 → 토큰 패턴 속성 (옮길 수 없으면 빈 dict = 조건 없음)"""
+    kinds = {lex.match[name] for name in names}
+    if len(kinds) != 1 or next(iter(kinds)) not in LEXICON_MATCH_ATTRS:
+        return {}
+    words = sorted(set().union(*(lex.words(name) for name in names)))
+    return {LEXICON_MATCH_ATTRS[kinds.pop()]: {"IN": words}}
+
+
+class RuleMatchers:
+    """사전 1개 기준으로 컴파일한 matcher 묶음 (사전이 바뀌면 swap_lexicon()이 새로 만든다)"""
+    def __init__(self, vocab, lex: Lexicon):
+        self.lexicon = lex
+        self.dep_matcher = DependencyMatcher(vocab)
+        self.matcher = Matcher(vocab)
+
+        # repair_ccomp_to_infinitive_subject : ccomp의 자식 중 nsubj + TO
+        self.dep_matcher.add("ccomp_nsubj_to", [[
+            {"RIGHT_ID": "ccomp", "RIGHT_ATTRS": {"DEP": "ccomp"}},
+            {"LEFT_ID": "ccomp", "REL_OP": ">", "RIGHT_ID": "nsubj", "RIGHT_ATTRS": {"DEP": "nsubj"}},
+            {"LEFT_ID": "ccomp", "REL_OP": ">", "RIGHT_ID": "to", "RIGHT_ATTRS": {"TAG": "TO"}},
+        ]])
+        # assign_noun_complement_for_SVOC_noun_only : SVOC_noun_only 동사의 object + 명사 자식 (object보다 뒤인지는 Python에서)
+        self.dep_matcher.add("svoc_noun_complement", [[
+            {"RIGHT_ID": "verb", "RIGHT_ATTRS": {"POS": {"IN": ["VERB", "AUX"]}, **lexicon_pattern(lex, "SVOC_noun_only")}},
+            {"LEFT_ID": "verb", "REL_OP": ">", "RIGHT_ID": "obj", "RIGHT_ATTRS": {"DEP": {"IN": ["dobj", "obj"]}}},
+            {"LEFT_ID": "verb", "REL_OP": ">", "RIGHT_ID": "complement",
+             "RIGHT_ATTRS": {"DEP": {"IN": SVOC_NOUN_COMPLEMENT_DEPS}, "POS": {"IN": ["NOUN", "PROPN"]}}},
+        ]])
+        # assign_adj_object_complement_when_compound_object : SVOC 동사의 dobj ADJ + compound NOUN 자식
+        self.dep_matcher.add("svoc_adj_compound_object", [[
+            {"RIGHT_ID": "verb", "RIGHT_ATTRS": {"POS": "VERB", **lexicon_pattern(lex, "SVOC_adj_only", "SVOC_both")}},
+            {"LEFT_ID": "verb", "REL_OP": ">", "RIGHT_ID": "adj", "RIGHT_ATTRS": {"DEP": {"IN": ["dobj", "obj"]}, "POS": "ADJ"}},
+            {"LEFT_ID": "adj", "REL_OP": ">", "RIGHT_ID": "compound", "RIGHT_ATTRS": {"DEP": "compound", "POS": "NOUN"}},
+        ]])
+        # build_combine_tables : due/according 뒤의 첫 "to"
+        self.matcher.add("blacklist_to", [[
+            lexicon_pattern(lex, "blacklist_preposition_words"),
+            {"LOWER": {"NOT_IN": ["to"]}, "OP": "*"},
+            {"LOWER": "to"},
+        ]])
+
+
+class RuleMatches:
+    """문장 1개의 matcher 결과 : 규칙 이름 → 토큰 순번 tuple 목록 (Matcher는 (시작, 끝) 순번)"""
+    def __init__(self, doc, matchers: RuleMatchers):
+        strings = doc.vocab.strings
+        self.by_rule = {}
+        for match_id, token_ids in matchers.dep_matcher(doc):
+            self.by_rule.setdefault(strings[match_id], []).append(tuple(token_ids))
+        for match_id, start, end in matchers.matcher(doc):
+            self.by_rule.setdefault(strings[match_id], []).append((start, end - 1))
+
+    def get(self, name: str) -> list:
+        return self.by_rule.get(name, [])
+
+
+rule_matchers = RuleMatchers(nlp.vocab, lexicon) if RULE_MATCHER_ENGINE else None
+
+
+def rule_matchers_for(lex: Lexicon) -> RuleMatchers:
+    global rule_matchers
+    matchers = rule_matchers
+    if matchers is None or matchers.lexicon is not lex:
+        matchers = RuleMatchers(nlp.vocab, lex)  # 사전 교체 직전에 시작한 문장 등 (드묾)
+        if lex is lexicon:
+            rule_matchers = matchers
+    return matchers
+
+
+def doc_from_tokens(tokens: list):
+    """캐시된 토큰 테이블 → 파싱 결과만 담은 Doc (모델 실행 없음, matcher용)"""
+    position = {t["idx"]: p for p, t in enumerate(tokens)}
+    ends = [t["idx"] + len(t["text"]) for t in tokens]
+    return Doc(
+        nlp.vocab,
+        words=[t["text"] for t in tokens],
+        spaces=[p + 1 < len(tokens) and tokens[p + 1]["idx"] > ends[p] for p in range(len(tokens))],
+        pos=[t["pos"] or None for t in tokens],
+        tags=[t["tag"] for t in tokens],
+        deps=["ROOT" if t["dep"] == "root" else t["dep"] for t in tokens],
+        heads=[position[t["head_idx"]] for t in tokens],
+        lemmas=[t["lemma"] for t in tokens],
+    )
+
+
 # rule 기반 분석 뼈대 함수 선언
-def rule_based_parse(tokens):
+def rule_based_parse(tokens, index: TokenIndex = None, columns: TokenColumns = None):
+    index = index or TokenIndex(tokens)
     result = []
-    for t in tokens:
-        t["children"] = [c["idx"] for c in tokens if c["head_idx"] == t["idx"]]
+    roles = guess_roles_columnar(columns) if columns is not None else None
+    for p, t in enumerate(tokens):
+        t["children"] = [c["idx"] for c in index.children_of(t["idx"])]
         t["role1"] = None
         t["role2"] = None
         t["role3"] = None
 
 
         # role 추론
-        role1 = guess_role(t, tokens)
+        role1 = ROLE_NAMES[roles[p]] if roles is not None else guess_role(t, tokens, index)
         if role1:
             t["role1"] = role1  # combine에서 쓰일 수 있음
             t["role2"] = role1  
@@ -183,21 +876,30 @@ def rule_based_parse(tokens):
 
     # 'name'과 같은 동사가 있는 SVOC구조에서 목적보어를 잘못 태깅하는 것 보정 함수
     result = tokens  # 기존 tokens을 수정하며 계속 사용
-    result = assign_noun_complement_for_SVOC_noun_only(result)
+    result = rule_passes.run(assign_noun_complement_for_SVOC_noun_only, result, index)
 
     # ✅ 보어 기반 object 복구 자동 적용
-    result = repair_object_from_complement(result)        
+    result = rule_passes.run(repair_object_from_complement, result, index)
+
+    result = rule_passes.run(repair_ccomp_to_infinitive_subject, result, index)
+
+    return result
 
 
 ######################################## 신경을 써야할 특별예외처리 부분 ###################################
 
-    ## 특별예외 : 계층발생 ccomp의 자식이 to부정사이고, to부정사의 주체인 앞단어를 nsubj로 태깅하는데,
-    #            nsubj가 덩어리요소 시작단어가 되버리는 경우 nsubj(you)를 object로 입력,
-    #            to를 noun object complement로 입력 (예문 : I want you to succeed.)
+## 특별예외 : 계층발생 ccomp의 자식이 to부정사이고, to부정사의 주체인 앞단어를 nsubj로 태깅하는데,
+#            nsubj가 덩어리요소 시작단어가 되버리는 경우 nsubj(you)를 object로 입력,
+#            to를 noun object complement로 입력 (예문 : I want you to succeed.)
+@rule_passes.register(triggers=[{"dep:ccomp"}, {"dep:nsubj"}, {"tag:TO"}])
+def repair_ccomp_to_infinitive_subject(tokens, index: TokenIndex = None):
+    index = index or TokenIndex(tokens)
+    if index.matches is not None:
+        return repair_ccomp_to_infinitive_subject_matched(tokens, index)
     for t in tokens:
         if t.get("dep") == "ccomp":
             #이경우 ccomp의 자식은 to앞단어(nsubj), to(TO) 모두 ccomp를 head로 본다.
-            children = [child for child in tokens if child.get("head_idx") == t["idx"]]
+            children = index.children_of(t["idx"])
             nsubj_child = next((child for child in children if child.get("dep") == "nsubj"), None)
             to_child = next((child for child in children if child.get("tag") == "TO"), None)
 
@@ -206,18 +908,34 @@ def rule_based_parse(tokens):
                 nsubj_child["role1"] = "object"
                 to_child["role1"] = "noun object complement"
     # assign_level_trigger_ranges에서는 you와 to의 레벨값을 보정함.
+    return tokens
 
-#######################################################################################################
 
-    return result
+# 위 함수의 matcher 버전 : ccomp마다 첫 nsubj / 첫 TO 자식 (매치는 자식 조합마다 1개씩 나옴)
+def repair_ccomp_to_infinitive_subject_matched(tokens, index: TokenIndex):
+    first = {}  # ccomp 순번 → (nsubj 순번, TO 순번)
+    for ccomp, nsubj, to in index.matches.get("ccomp_nsubj_to"):
+        found = first.get(ccomp)
+        first[ccomp] = (nsubj, to) if found is None else (min(found[0], nsubj), min(found[1], to))
+
+    for ccomp in sorted(first):
+        nsubj, to = first[ccomp]
+        nsubj_child, to_child = index.tokens[nsubj], index.tokens[to]
+        nsubj_child["role1"] = "object"
+        to_child["role1"] = "noun object complement"
+    return tokens
+
+#######################################################################################################
 
 
 
 # role 추론 함수
-def guess_role(t, all_tokens=None):  # all_tokens 추가 필요
+def guess_role(t, all_tokens=None, index: TokenIndex = None):  # all_tokens 추가 필요
+    index = index or TokenIndex(all_tokens)
     dep = t.get("dep")
     pos = t["pos"]
     head_idx = t.get("head_idx")
+    head_token = index.get(head_idx)
 
     # ✅ Subject
     if dep in {"nsubj", "nsubjpass"}:
@@ -229,7 +947,7 @@ def guess_role(t, all_tokens=None):  # all_tokens 추가 필요
 
     # ✅ 등위접속사 다음 병렬 동사 (conj)도 verb role 부여
     if pos == "VERB" and dep == "conj":
-        if any(t["idx"] == head_idx and t.get("role1") == "verb" for t in all_tokens):
+        if head_token and head_token.get("role1") == "verb":
             return "verb"
 
 
@@ -239,33 +957,30 @@ def guess_role(t, all_tokens=None):  # all_tokens 추가 필요
 
     # ✅ Direct Object (SVOO 구조 판단)
     if dep in ["dobj", "obj"]:
-        if head_lemma := next((t["lemma"] for t in all_tokens if t["idx"] == head_idx), None):
-            if head_lemma in noObjectVerbs:
-                return None  # ❌ 목적어 금지 동사 → 무시
-
-        # ✅ 기존 object 판단 로직
-        if all_tokens:
-            for other in all_tokens:
-                if other.get("dep") in ["iobj", "dative"] and other.get("head_idx") == head_idx:
-                    return "direct object"
+        if head_token and index.lex_of(head_token) & LEX["noObjectVerbs"]:
+            return None  # ❌ 목적어 금지 동사 → 무시
+
+        # ✅ 기존 object 판단 로직 (같은 head 아래 iobj/dative가 있으면 direct object)
+        for other in index.children_of(head_idx):
+            if other.get("dep") in ["iobj", "dative"]:
+                return "direct object"
         return "object"
 
 
     # ✅ Preposition: 기본 prep, agent + 보완 (pcomp), 단 blacklist 단어는 제외
     if (
         (dep in ["prep", "agent"] or (dep == "pcomp" and pos == "ADP" and t.get("tag") == "IN"))
-        and t["text"].lower() not in blacklist_preposition_words
+        and not index.lex_of(t) & LEX["blacklist_preposition_words"]
     ):
         return "preposition"
 
     # ✅ Prepositional Object (by ~pobj 구조 커버)
     # 위 Preposition Role결정시 blacklist 단어에 의해 전치사의 목적어를 못찾는 문제 보정
     if dep == "pobj":
-        head_token = next((t for t in all_tokens if t["idx"] == head_idx), None)
         if head_token and (
             head_token.get("role1") == "preposition"
             or (
-                head_token["text"].lower() in blacklist_preposition_words and
+                index.lex_of(head_token) & LEX["blacklist_preposition_words"] and
                 (
                     head_token.get("pos") == "ADP" or
                     head_token.get("dep") == "prep" or
@@ -281,9 +996,8 @@ def guess_role(t, all_tokens=None):  # all_tokens 추가 필요
 
     # ✅ Subject Complement (SVC 구조)
     if dep in ["attr", "acomp"]:
-        if head_lemma := next((t["lemma"] for t in all_tokens if t["idx"] == head_idx), None):
-            if head_lemma in noSubjectComplementVerbs:
-                return None  # ❌ 보어 불가 동사 → 차단
+        if head_token and index.lex_of(head_token) & LEX["noSubjectComplementVerbs"]:
+            return None  # ❌ 보어 불가 동사 → 차단
 
         if pos in ["NOUN", "PROPN", "PRON"]:
             return "noun subject complement"
@@ -299,31 +1013,31 @@ def guess_role(t, all_tokens=None):  # all_tokens 추가 필요
 
     # ✅ Object Complement (보완 케이스: dep=advmod, pos=ADJ, head=VERB, dobj 존재 시)
     if dep == "advmod" and pos == "ADJ":
-        for tok in all_tokens:
-            if tok["idx"] == head_idx and tok["pos"] == "VERB":
-                obj_exists = any(
-                    c.get("head_idx") == tok["idx"] and c.get("dep") in ["dobj", "obj"]
-                    for c in all_tokens
-                )
-                if obj_exists:
-                    return "adjective object complement"
+        if head_token and head_token["pos"] == "VERB":
+            obj_exists = any(
+                c.get("dep") in ["dobj", "obj"]
+                for c in index.children_of(head_token["idx"])
+            )
+            if obj_exists:
+                return "adjective object complement"
                 
     # ✅ 그 외는 DrawEnglish 도식에서 사용 안 함
     return None
 
 
 # dep가 dative여서 indiret object가 있는데, 뒤쪽에 direct object role이 없는 경우 보정
-def recover_direct_object_from_indirect(parsed):
+@rule_passes.register(triggers=[{"role:indirect object"}, {"dep:appos"}])
+def recover_direct_object_from_indirect(parsed, index: TokenIndex = None):
     """
     SVOO 문장에서 indirect object에 대해 appos 구조의 direct object를 복원
     """
+    index = index or TokenIndex(parsed)
     for token in parsed:
         if token.get("role1") == "indirect object":
             token_idx = token.get("idx")
 
-            for child in parsed:
+            for child in index.children_of(token_idx):
                 if (
-                    child.get("head_idx") == token_idx and
                     child.get("dep") == "appos" and
                     child.get("pos") in {"NOUN", "PROPN"}
                 ):
@@ -335,32 +1049,35 @@ def recover_direct_object_from_indirect(parsed):
 
 # 목적보어로 명사만 취하는 동사 사용 문장에서 목적보어를 잘못 태깅하는 것 보정
 # 그 후 아래 repair_object_from_complement()함수를 통해 목적어를 보정함
-def assign_noun_complement_for_SVOC_noun_only(parsed):
+@rule_passes.register(triggers=[{"lex:SVOC_noun_only"}, {"dep:dobj", "dep:obj"}])
+def assign_noun_complement_for_SVOC_noun_only(parsed, index: TokenIndex = None):
     """
     SVOC 구조 동사들(SVOC_noun_only 사전에 등록)의 목적보어가 spaCy에서 잘못 태깅된 경우
     noun object complement로 1회 보정 단, object 이후의 단어만 대상으로 한다.
     """
+    index = index or TokenIndex(parsed)
+    if index.matches is not None:
+        return assign_noun_complement_for_SVOC_noun_only_matched(parsed, index)
     applied = False
 
     for i, token in enumerate(parsed):
-        if token.get("lemma") in SVOC_noun_only and token.get("pos") in ["VERB", "AUX"]:
+        if index.lex_of(token) & LEX["SVOC_noun_only"] and token.get("pos") in ["VERB", "AUX"]:
             verb_idx = token["idx"]
 
             # object 확인
-            obj = next((t for t in parsed if t.get("head_idx") == verb_idx and t.get("dep") in ["dobj", "obj"]), None)
+            obj = next((t for t in index.children_of(verb_idx) if t.get("dep") in ["dobj", "obj"]), None)
             if not obj:
                 continue
 
             obj_idx = obj["idx"]
 
             # 보어 후보 찾기 : objedt 뒤에 있는 명사사
-            for t in parsed:
+            for t in index.children_of(verb_idx):
                 if applied:
                     break
 
                 if (
                     t.get("idx") > obj_idx and  # ✅ object 이후에 등장한 단어만
-                    t.get("head_idx") == verb_idx and
                     t.get("dep") in ["nsubj", "nmod", "attr", "appos", "npadvmod", "ccomp"] and
                     t.get("pos") in ["NOUN", "PROPN"]
                 ):
@@ -370,29 +1087,46 @@ def assign_noun_complement_for_SVOC_noun_only(parsed):
 
     return parsed
 
+
+# 위 함수의 matcher 버전 : 문장에서 가장 앞 동사의 가장 앞 보어 1개만 (object는 아무거나 보어보다 앞이면 됨 = 첫 object보다 뒤)
+def assign_noun_complement_for_SVOC_noun_only_matched(parsed, index: TokenIndex):
+    best = None
+    for verb, obj, complement in index.matches.get("svoc_noun_complement"):
+        if complement > obj and index.lex_of(index.tokens[verb]) & LEX["SVOC_noun_only"]:
+            best = min(best or (verb, complement), (verb, complement))
+    if best is not None:
+        index.tokens[best[1]]["role1"] = "noun object complement"
+    return parsed
+
 # 목적보어로 형용사만 또는 형용사/명사를 모두 취하는 동사 사용 문장에서 목적보어를 잘못 태깅하는 것 보정
 # 그 후 아래 repair_object_from_complement()함수를 통해 목적어를 보정함
 # 예: "She painted the wall green."
-def assign_adj_object_complement_when_compound_object(parsed):
+@rule_passes.register(triggers=[{"lex:SVOC_adj_only", "lex:SVOC_both"}, {"dep:dobj", "dep:obj"}, {"pos:ADJ"}, {"dep:compound"}])
+def assign_adj_object_complement_when_compound_object(parsed, index: TokenIndex = None):
+    index = index or TokenIndex(parsed)
+    if index.matches is not None:
+        for verb, adj, _ in index.matches.get("svoc_adj_compound_object"):
+            if index.lex_of(index.tokens[verb]) & (LEX["SVOC_adj_only"] | LEX["SVOC_both"]):
+                index.tokens[adj]["role1"] = "adjective object complement"
+        return parsed
+
     for verb in parsed:
         if verb.get("pos") != "VERB":
             continue
 
-        verb_lemma = verb.get("lemma")
-        if verb_lemma not in SVOC_adj_only and verb_lemma not in SVOC_both:
+        if not index.lex_of(verb) & (LEX["SVOC_adj_only"] | LEX["SVOC_both"]):
             continue
 
         verb_idx = verb["idx"]
 
         # 보어 후보: VERB의 자식 중 dep=obj, pos=ADJ
-        for t in parsed:
+        for t in index.children_of(verb_idx):
             if (
-                t.get("head_idx") == verb_idx and
                 t.get("dep") in ["dobj", "obj"] and
                 t.get("pos") == "ADJ"
             ):
                 # ✅ 이 ADJ의 children에 compound가 붙어 있으면 보정 대상
-                children = [c for c in parsed if c.get("head_idx") == t["idx"]]
+                children = index.children_of(t["idx"])
                 has_compound = any(
                     c.get("dep") == "compound" and c.get("pos") == "NOUN"
                     for c in children
@@ -404,22 +1138,24 @@ def assign_adj_object_complement_when_compound_object(parsed):
 
 # SVOC_both 동사에 속해 있고, 뒤에 role(object)가 있고, 그 뒤에 advcl, ADJ 이면서 HEAD가 object와 같을때
 # adjective object complement로 보정.  예: He painted the kitchen walls blue.
-def assign_adj_complement_for_advcl_adjective(parsed):
+@rule_passes.register(triggers=[{"lex:SVOC_both"}, {"dep:advcl"}, {"pos:ADJ"}, {"role:object", "role:direct object"}])
+def assign_adj_complement_for_advcl_adjective(parsed, index: TokenIndex = None):
     """
     spaCy가 형용사 목적보어를 advcl로 잘못 태깅했을 때 보정
     예: "He painted the walls blue."
     """
+    index = index or TokenIndex(parsed)
     for verb in parsed:
         if verb.get("pos") != "VERB":
             continue
-        if verb.get("lemma") not in SVOC_both:
+        if not index.lex_of(verb) & LEX["SVOC_both"]:
             continue
 
         verb_idx = verb["idx"]
 
         # 1. object 있는지 먼저 확인
         obj = next(
-            (t for t in parsed if t.get("head_idx") == verb_idx and t.get("role1") in ["object", "direct object"]),
+            (t for t in index.children_of(verb_idx) if t.get("role1") in ["object", "direct object"]),
             None
         )
         if not obj:
@@ -428,10 +1164,9 @@ def assign_adj_complement_for_advcl_adjective(parsed):
         obj_idx = obj["idx"]
 
         # 2. object 이후 등장한 형용사 중 특정 조건을 만족하면 보어로 간주
-        for t in parsed:
+        for t in index.children_of(verb_idx):
             if (
                 t.get("idx") > obj_idx and
-                t.get("head_idx") == verb_idx and
                 t.get("dep") == "advcl" and
                 t.get("pos") == "ADJ"
             ):
@@ -440,15 +1175,18 @@ def assign_adj_complement_for_advcl_adjective(parsed):
 
 
 # 목적보어(object complement)가 있는데, 앞쪽 목적어를 nsubj(subject)로 잘못 태깅하는 경우 예외처리
-def repair_object_from_complement(parsed):
+@rule_passes.register(triggers=[{"role:noun object complement", "role:adjective object complement"}, {"dep:nsubj", "dep:compound"}])
+def repair_object_from_complement(parsed, index: TokenIndex = None):
+    index = index or TokenIndex(parsed)
     for item in parsed:
         if item.get("role1") in ["noun object complement", "adjective object complement"]:
-            complement_children = item.get("children", [])
+            # rule_based_parse()에서 저장한 자식 idx 목록 (문장 순서)
+            complement_children = [index.get(i) for i in item.get("children", [])]
 
             # 1️⃣ 먼저: nsubj 먼저 찾기
             found_object = False
-            for t in parsed:
-                if t.get("dep") == "nsubj" and t.get("idx") in complement_children:
+            for t in complement_children:
+                if t.get("dep") == "nsubj":
                     t["role1"] = "object"
                     found_object = True
                     break  # ✅ 단 1회만 보정
@@ -456,9 +1194,8 @@ def repair_object_from_complement(parsed):
             # 2️⃣ 그 다음: compound 찾기 (nsubj 없을 경우만)
             if not found_object:
                 compound_candidates = [
-                    t for t in parsed 
+                    t for t in complement_children
                     if (
-                        t["idx"] in complement_children and
                         t.get("dep") == "compound" and
                         t.get("pos") == "NOUN" and
                         t.get("head_idx") == item["idx"]
@@ -473,8 +1210,55 @@ def repair_object_from_complement(parsed):
 
 
 
+# combine 계산에 필요한 문장 단위 테이블 (문장당 1번, O(n)으로 생성)
+def build_combine_tables(parsed, index: TokenIndex) -> dict:
+    """
+    - direct_objects_by_head : head(또는 head의 head) idx → 그 아래 direct object 토큰들 (문장 순서)
+    - blacklist_pobj_by_to   : due/according 뒤의 첫 "to" idx → 그 blacklist 단어의 prepositional object들
+    """
+    direct_objects_by_head = {}
+    blacklist_pobj_by_to = {}
+    blacklist_to_idx = {}  # blacklist 단어 idx → 그 뒤 첫 "to" idx (없으면 None)
+    next_to_idx = None
+
+    if index.matches is not None:
+        # matcher 결과 : (blacklist 단어, 그 뒤 첫 to) 순번
+        for start, to in index.matches.get("blacklist_to"):
+            if index.lex_of(index.tokens[start]) & LEX["blacklist_preposition_words"]:
+                blacklist_to_idx[index.tokens[start]["idx"]] = index.tokens[to]["idx"]
+    else:
+        # 뒤에서부터 훑으면서 "각 위치 다음의 첫 to"를 기록
+        for t in reversed(parsed):
+            if index.lex_of(t) & LEX["blacklist_preposition_words"]:
+                blacklist_to_idx[t["idx"]] = next_to_idx
+            if t["text"].lower() == "to":
+                next_to_idx = t["idx"]
+
+    for t in parsed:
+        role1 = t.get("role1")
+        if role1 == "direct object":
+            t_head_token = index.get(t.get("head_idx"))
+            t_head2_idx = t_head_token.get("head_idx") if t_head_token else None
+            for h in dict.fromkeys((t.get("head_idx"), t_head2_idx)):
+                direct_objects_by_head.setdefault(h, []).append(t)
+
+        elif role1 == "prepositional object":
+            to_idx = blacklist_to_idx.get(t.get("head_idx"))
+            if to_idx is not None:
+                blacklist_pobj_by_to.setdefault(to_idx, []).append(t)
+
+    return {
+        "direct_objects_by_head": direct_objects_by_head,
+        "blacklist_pobj_by_to": blacklist_pobj_by_to,
+    }
+
+
 # combine 추론 함수
-def guess_combine(token, all_tokens):
+# 토큰 전체를 다시 훑지 않고 인덱스(자식, 손자, head)와 build_combine_tables()의 테이블만 본다.
+# → 문장 전체에 대해 돌려도 토큰 수에 비례하는 시간만 든다.
+def guess_combine(token, all_tokens, index: TokenIndex = None, tables: dict = None):
+    index = index or TokenIndex(all_tokens)
+    tables = tables or build_combine_tables(all_tokens, index)
     token_role1 = token.get("role1")
     token_idx = token.get("idx")
     combine = []
@@ -483,77 +1267,70 @@ def guess_combine(token, all_tokens):
     token_head_idx = token.get("head_idx")
 
     # ✅ Verb → object / complement (SVO, SVC)
+    # 후보: 오른쪽에 있는 자식(head == verb) 또는 같은 level의 손자(head의 head == verb) 중 문장에서 가장 앞선 것
     if token_role1 == "verb":
-        for t in all_tokens:
-            if t.get("idx", -1) <= token_idx: # 이전 토큰이면 continue(다음 토큰부터 찾음)
-                continue
-            t_head_idx = t.get("head_idx")
-            t_head_token = next((x for x in all_tokens if x.get("idx") == t_head_idx), None)
-            t_head2_idx = t_head_token.get("head_idx") if t_head_token else None
-            t_level = t.get("level")
-
-            if (
-                t_head_idx == token_idx or t_head2_idx == token_idx
-                and t["idx"] > token_idx  # 🔧 오른쪽 방향 연결만 허용
-                and int(t_level) == token_current_level
-            ):
-                r = t.get("role1")
-                if r in [
-                    "object",
-                    "indirect object",
-                    "direct object",
-                    "noun subject complement",
-                    "adjective subject complement",
-#                    "noun object complement",
-#                    "adjective object complement"  # 🔧 보어도 연결되게!
-                ]:
-                    combine.append({"text": t["text"], "role1": r, "idx": t["idx"]})
-
-                    # ✅ 보완: indirect object가 자식 갖고 있으면 그 중 direct object도 연결
-                    # ♥♥♥ 이 보완함수를 적용해야 하는 문장을 못찾겠음..
-                    if r == "indirect object":
-                        children = [c for c in all_tokens if c.get("head_idx") == t["idx"]]
-                        for c in children:
-                            if (
-                                c.get("role1") in ["direct object", "object"]
-                                and c["idx"] > t["idx"]  # 🔧 핵심 추가
-                            ):
-                                combine.append({"text": c["text"], "role1": c["role1"], "idx": c["idx"]})
-
-                    break
+        candidates = []
+        for child in index.children_of(token_idx):
+            if child["idx"] > token_idx:
+                candidates.append(child)
+            for grandchild in index.children_of(child["idx"]):
+                if (
+                    grandchild["idx"] > token_idx  # 🔧 오른쪽 방향 연결만 허용
+                    and int(grandchild.get("level")) == token_current_level
+                ):
+                    candidates.append(grandchild)
+
+        for t in sorted(candidates, key=lambda x: x["idx"]):
+            r = t.get("role1")
+            if r in [
+                "object",
+                "indirect object",
+                "direct object",
+                "noun subject complement",
+                "adjective subject complement",
+#                "noun object complement",
+#                "adjective object complement"  # 🔧 보어도 연결되게!
+            ]:
+                combine.append({"text": t["text"], "role1": r, "idx": t["idx"]})
+
+                # ✅ 보완: indirect object가 자식 갖고 있으면 그 중 direct object도 연결
+                # ♥♥♥ 이 보완함수를 적용해야 하는 문장을 못찾겠음..
+                if r == "indirect object":
+                    children = index.children_of(t["idx"])
+                    for c in children:
+                        if (
+                            c.get("role1") in ["direct object", "object"]
+                            and c["idx"] > t["idx"]  # 🔧 핵심 추가
+                        ):
+                            combine.append({"text": c["text"], "role1": c["role1"], "idx": c["idx"]})
+
+                break
 
     # ✅ Indirect object / object → direct object (SVOO 구조)
+    # 후보: 같은 head(또는 head의 head)를 가진 오른쪽 direct object
     if token_role1 in ("indirect object", "object"):
-
-        for t in all_tokens:
-            if t.get("idx", -1) <= token_idx:
-                continue
-            t_head_idx = t.get("head_idx")
-            t_head_token = next((x for x in all_tokens if x.get("idx") == t_head_idx), None)
-            t_head2_idx = t_head_token.get("head_idx") if t_head_token else None
-            t_level = t.get("level")
-
-            if (
-                t.get("role1") == "direct object" and
-                t.get("idx") > token_idx and
-                int(t_level) == token_current_level
-            ):
-
-                if t_head_idx == token_head_idx or t_head2_idx == token_head_idx:
-                    combine.append({
-                        "text": t["text"], "role1": "direct object", "idx": t["idx"]
-                    })
+        for t in tables["direct_objects_by_head"].get(token_head_idx, []):
+            if t["idx"] > token_idx and int(t.get("level")) == token_current_level:
+                combine.append({
+                    "text": t["text"], "role1": "direct object", "idx": t["idx"]
+                })
 
     # ✅ Object → object complement (SVOC 구조)
+    # 후보: object의 head 자신, 또는 object와 head가 같은 형제 토큰
     if token_role1 == "object":
-        for t in all_tokens:
+        token_head = token.get("head_idx")
+        candidates = list(index.children_of(token_head))
+        head_token = index.get(token_head)
+        if head_token is not None and head_token not in candidates:
+            candidates.append(head_token)
+
+        for t in sorted(candidates, key=lambda x: x["idx"]):
             t_role1 = t.get("role1") or ""
             t_level = t.get("level")
             if t_role1 in ("noun object complement", "adjective object complement"):
                 t_head = t.get("head_idx")
-                token_head = token.get("head_idx")
                 if (
-                    token_idx in [c.get("idx") for c in all_tokens if c.get("head_idx") == t.get("idx")]
+                    token_head == t.get("idx")
                     or (t_head is not None and t_head == token_head)
                 ):
                     combine.append({"text": t["text"], "role1": t["role1"], "idx": t["idx"]})
@@ -571,45 +1348,37 @@ def guess_combine(token, all_tokens):
 
     # ✅ Preposition → prepositional object
     if token_role1 == "preposition":
-        for t in all_tokens:
+        for t in index.children_of(token_idx):
             t_level = t.get("level")
             if (
-                t.get("role1") == "prepositional object" and t.get("head_idx") == token_idx
+                t.get("role1") == "prepositional object"
                 and int(t_level) == token_current_level
             ):
                 print(f"[DEBUG] prepositional object t.level={t.get('level')}, token.level={token_current_level}")
                 combine.append({"text": t["text"], "role1": "prepositional object", "idx": t["idx"]})
 
-        # 2️⃣ 예외 보정: head가 due/according인데, 이 token이 그 뒤의 "to"일 경우
-    for t in all_tokens:
-        if (
-            t.get("role1") == "prepositional object" and
-            t.get("head_idx") in [
-                b["idx"] for b in all_tokens if b["text"].lower() in blacklist_preposition_words
-            ]
-        ):
-            # 👉 head token
-            t_head_idx = t.get("head_idx")
-            t_head_token = next((tok for tok in all_tokens if tok["idx"] == t_head_idx), None)
-
-            # ✅ head_token 다음에서 "to" 찾기
-            to_token = next(
-                (
-                    tok for tok in all_tokens
-                    if tok["text"].lower() == "to" and tok["idx"] > t_head_token["idx"]
-                ),
-                None
-            )
-
-            # ✅ 이 token이 그 "to"일 경우만 연결
-            if to_token and to_token["idx"] == token_idx:
-                combine.append({"text": t["text"], "role1": t["role1"], "idx": t["idx"]})
+    # 2️⃣ 예외 보정: head가 due/according인데, 이 token이 그 뒤의 "to"일 경우
+    for t in tables["blacklist_pobj_by_to"].get(token_idx, []):
+        combine.append({"text": t["text"], "role1": t["role1"], "idx": t["idx"]})
 
     # ✅ combine 있을 경우만 반환
     return combine if combine else None
 
 
-def assign_level_trigger_ranges(parsed):
+# 문장 전체 토큰의 combine을 한번에 계산 (테이블은 1번만 생성)
+@rule_passes.register()  # 항상 실행
+def assign_combines(parsed, index: TokenIndex = None):
+    index = index or TokenIndex(parsed)
+    tables = build_combine_tables(parsed, index)
+    for t in parsed:
+        combine = guess_combine(t, parsed, index, tables)
+        if combine:
+            t["combine"] = combine
+    return parsed
+
+
+@rule_passes.register()  # 항상 실행 (level=None → 0 설정 포함)
+def assign_level_trigger_ranges(parsed, index: TokenIndex = None):
     """
     종속절을 담당하는 dep (relcl, acl, advcl, ccomp, xcomp)에 따라
     해당 절 범위에 level 값을 부여한다.
@@ -619,11 +1388,27 @@ def assign_level_trigger_ranges(parsed):
     
     그리고 마지막에 level=None인 토큰들에 대해 level=0을 부여한다.
     """
+    index = index or TokenIndex(parsed)
 
-    clause_units = []  # 함수 맨 위에서 초기화
     current_level = 1  # 시작은 1부터 (0은 최상위 절용)
     reset_after_root = False  # ✅ ROOT 이후 레벨 초기화 플래그
     all_clause_indices = []  # 절 단위 인덱스 리스트들을 모아둠
+    clause_spans = []  # 절마다 (시작 idx, 끝 idx)
+    clause_members = {}  # 토큰 idx → 그 토큰이 들어있는 절 번호들 (절 = 트리거 + 직계 자식이라 최대 2개)
+
+    # ✅ 아직 level이 없는 토큰만 건너뛰며 찾는 포인터 (이미 채운 구간은 다시 훑지 않음)
+    #    next_open[p] : 순번 p 이후(포함) 첫 번째 level=None 토큰 순번 (경로 압축)
+    tokens = index.tokens
+    next_open = [p if t.get("level") is None else p + 1 for p, t in enumerate(tokens)]
+    next_open.append(len(tokens))
+
+    def find_open(p):
+        root = p
+        while next_open[root] != root:
+            root = next_open[root]
+        while next_open[p] != root:
+            next_open[p], p = root, next_open[p]
+        return root
 
     for token in parsed:
         dep = token.get("dep")
@@ -643,24 +1428,26 @@ def assign_level_trigger_ranges(parsed):
             continue
 
         token_idx = token["idx"]
-        clause_tokens = [token]  # 시작은 자기 자신 포함
-
-        children = [t for t in parsed if t["head_idx"] == token_idx]
-        clause_tokens.extend(children)
+        children = index.children_of(token_idx)
+        clause_tokens = [token] + children  # 시작은 자기 자신 포함
 
         clause_indices = sorted([t["idx"] for t in clause_tokens])
  
+        for idx in clause_indices:
+            clause_members.setdefault(idx, []).append(len(all_clause_indices))
         all_clause_indices.append(clause_indices)
 
         # ✅ 절 범위 시작 ~ 끝 계산
-        start_idx = min(t["idx"] for t in clause_tokens)
-        end_idx = max(t["idx"] for t in clause_tokens)
+        start_idx, end_idx = index.child_span(token_idx)
+        clause_spans.append((start_idx, end_idx))
 
-        # ✅ level 부여
-        for t in parsed:
-            if start_idx <= t["idx"] <= end_idx:
-                if t.get("level") is None:
-                    t["level"] = current_level
+        # ✅ level 부여 (level=None 토큰만)
+        end_pos = index.position[end_idx]
+        p = find_open(index.position[start_idx])
+        while p <= end_pos:
+            tokens[p]["level"] = current_level
+            next_open[p] = p + 1
+            p = find_open(p + 1)
 
 
 ######################################## 신경을 써야할 특별예외처리 부분 ###################################
@@ -670,15 +1457,14 @@ def assign_level_trigger_ranges(parsed):
     #            you는(.5)를 없앰 (예문 : I want you to succeed.)
 
         # ✅ 단어덩어리 맨 앞 토큰 찾기
-        sorted_clause = sorted(clause_tokens, key=lambda x: x["idx"])
-        first_token = sorted_clause[0]
+        first_token = index.get(start_idx)
 
         # 🔥 단어덩어리 맨 앞 단어가 nsubj인지 체크
         if first_token.get("dep") == "nsubj":
             to_token = next((child for child in children if child.get("tag") == "TO"), None)
             if to_token:
                 to_head_idx = to_token.get("head_idx")
-                to_head_token = next((t for t in parsed if t["idx"] == to_head_idx), None)
+                to_head_token = index.get(to_head_idx)
 
                 if to_head_token and to_head_token.get('dep') == "ccomp":
                     # 🎯 핵심: TO가 연결된 ccomp 절이면 레벨 설정
@@ -701,7 +1487,7 @@ def assign_level_trigger_ranges(parsed):
             token["level"] = current_level - 0.5  # 연결어는 바로 이전 절에서 이어짐
         else:
             # 연결어 후보: 절 범위 앞 단어 중 연결사 역할
-            connector = min(clause_tokens, key=lambda x: x["idx"])
+            connector = first_token
             connector["level"] = current_level - 0.5
 
         current_level += 1
@@ -713,23 +1499,24 @@ def assign_level_trigger_ranges(parsed):
 
     print(f"[DEBUG] {all_clause_indices}")
 
-     # [1] 겹치는 인덱스에 대해 후속 절(j)의 level을 +1 보정 (단, 안긴절이 안은절을 완전히 포함할 경우 제외)
-    # 해당 예문) He told me that she wanted to eat something. (eat가 상하위덩어리 겹침)
-    for i in range(len(all_clause_indices)):            # i는 0부터 2까지(덩어리가 3개일 경우)
-        for j in range(i + 1, len(all_clause_indices)): # j는 1 부터 2까지
-            first = all_clause_indices[i]               # first는 앞쪽 덩어리
-            second = all_clause_indices[j]              # secon는 뒤쪽 덩어리
-
-            # ✅ 겹치는 요소가 있는지 확인
-            overlap = set(first) & set(second)
-
-            # ✅ second가 first를 완전히 감싸고 있으면 이 보정은 skip (→ 아래 보정에 맡김)
-            if (second[0] < first[0] and second[-1] > first[-1]) and overlap:
-                continue  # 건너뛴다
+    def surrounds(outer, inner):
+        """outer 절 구간이 inner 절 구간을 양쪽 모두 넘어서 감싸는지"""
+        return clause_spans[outer][0] < clause_spans[inner][0] and clause_spans[outer][1] > clause_spans[inner][1]
 
-            # ✅ 중복된 idx에 대해 후속 절의 level +1 보정
-            for idx in overlap:
-                t = next((tok for tok in parsed if tok["idx"] == idx), None)
+    # [1] 겹치는 인덱스에 대해 후속 절(j)의 level을 +1 보정 (단, 안긴절이 안은절을 완전히 포함할 경우 제외)
+    # 해당 예문) He told me that she wanted to eat something. (eat가 상하위덩어리 겹침)
+    # 두 절이 겹치는 토큰 = 절 2개에 동시에 속한 토큰이므로, 절 쌍을 모두 비교하지 않고 그 토큰들만 본다.
+    for idx, members in clause_members.items():
+        for a in range(len(members)):
+            for b in range(a + 1, len(members)):
+                first, second = members[a], members[b]  # first는 앞쪽 덩어리, second는 뒤쪽 덩어리
+
+                # ✅ second가 first를 완전히 감싸고 있으면 이 보정은 skip (→ 아래 보정에 맡김)
+                if surrounds(second, first):
+                    continue  # 건너뛴다
+
+                # ✅ 중복된 idx에 대해 후속 절의 level +1 보정
+                t = index.get(idx)
                 if t and isinstance(t.get("level"), int):
                     t["level"] = t["level"] + 1
 
@@ -740,15 +1527,18 @@ def assign_level_trigger_ranges(parsed):
         first = all_clause_indices[i]               # first는 앞덩어리
         second = all_clause_indices[i + 1]          # second는 뒤덩어리
 
-        if second[0] < first[0] and second[-1] > first[-1]:
+        if surrounds(i + 1, i):
             # ✅ 안은 절 (first) +1
-            for t in parsed:
-                if t["idx"] in first and t.get("level") is not None:
+            for idx in first:
+                t = index.get(idx)
+                if t.get("level") is not None:
                     t["level"] += 1
 
             # ✅ 안긴 절 (second) -1 (겹치는 것 빼고)
-            for t in parsed:
-                if t["idx"] in second and t["idx"] not in first and t.get("level") is not None:
+            first_set = set(first)
+            for idx in second:
+                t = index.get(idx)
+                if idx not in first_set and t.get("level") is not None:
                     t["level"] -= 1
 
     return parsed
@@ -781,12 +1571,17 @@ def is_valid_clause_trigger(token: dict) -> bool:
     # 향후 더 예외조건이 생기면 여기에 추가
     return True
 
-def repair_level_within_prepositional_phrases(parsed):
+@rule_passes.register(triggers=[{"dep:prep", "dep:agent"}, {"dep:pobj"}])
+def repair_level_within_prepositional_phrases(parsed, index: TokenIndex = None, columns: TokenColumns = None):
     """
     전치사(prep 또는 agent)의 목적어(pobj) 레벨이 다를 경우
     전치사의 level 기준으로 범위 내 토큰들을 보정.
     예문) She is certain that he will arrive on time.
     """
+    if columns is not None:
+        return repair_level_within_prepositional_phrases_columnar(parsed, columns)
+
+    index = index or TokenIndex(parsed)
 
     for prep in parsed:
         if prep.get("dep") not in {"prep", "agent"}:
@@ -800,8 +1595,8 @@ def repair_level_within_prepositional_phrases(parsed):
 
         # ✅ 모든 토큰 중에서 pobj 후보 찾기 (children 조건 제외)
         pobj_candidates = [
-            t for t in parsed
-            if t.get("dep") == "pobj" and t.get("head_idx") == prep_idx
+            t for t in index.children_of(prep_idx)
+            if t.get("dep") == "pobj"
         ]
 
         for pobj in pobj_candidates:
@@ -814,17 +1609,46 @@ def repair_level_within_prepositional_phrases(parsed):
             start = min(prep_idx, pobj["idx"])
             end = max(prep_idx, pobj["idx"])
 
-            for t in parsed:
-                if start <= t["idx"] <= end:
-                    t["level"] = prep_level
+            for t in index.between(start, end):
+                t["level"] = prep_level
+
+    return parsed
+
+
+# 위 함수의 열 방식 버전 : 범위 보정을 배열 slice로 하고, 바뀐 토큰만 dict에 다시 쓴다.
+def repair_level_within_prepositional_phrases_columnar(parsed, cols: TokenColumns):
+    original = [t.get("level") for t in parsed]
+    level = np.array([np.nan if v is None else v for v in original], dtype=float)
+    source = np.arange(cols.n)  # 각 토큰 level을 어느 토큰의 원래 값에서 가져왔는지 (int/float 구분 유지용)
+    is_pobj = cols.dep_in(["pobj"])
+
+    for p in np.flatnonzero(cols.dep_in(["prep", "agent"])):
+        prep_level = level[p]
+        if np.isnan(prep_level):
+            continue
+        prep_source = source[p]
+
+        for q in np.flatnonzero(is_pobj & (cols.head == p)):
+            if level[q] == prep_level:
+                continue  # 이미 동일하면 건너뜀
+
+            # ✅ prep ~ pobj 사이 범위 level 보정
+            start, end = min(p, q), max(p, q)
+            level[start:end + 1] = prep_level
+            source[start:end + 1] = prep_source
+
+    for p in np.flatnonzero(source != np.arange(cols.n)):
+        parsed[p]["level"] = original[source[p]]
 
+    cols.level = level
     return parsed
 
 
-def get_chunk_types(token, all_tokens):
+def get_chunk_types(token, all_tokens, index: TokenIndex = None):
+    index = index or TokenIndex(all_tokens)
 
     head_idx = token.get("head_idx")
-    head_token = next((t for t in all_tokens if t["idx"] == head_idx), None)
+    head_token = index.get(head_idx)
 
     # 1️⃣ 종속절 (Subordinate Clause)
     if (
@@ -850,14 +1674,14 @@ def get_chunk_types(token, all_tokens):
             return "to_infinitive"
 
     # 3️⃣ bare infinitive (TO 없이 동사 원형)
+    prev_token = index.get(token["idx"] - 1)
     if (
         token.get("pos") == "VERB" and
         token.get("tag") == "VB" and
-        not any(
-            t.get("idx") == token["idx"] - 1 and
-            t.get("text", "").lower() == "to" and
-            t.get("tag") == "TO"
-            for t in all_tokens
+        not (
+            prev_token and
+            prev_token.get("text", "").lower() == "to" and
+            prev_token.get("tag") == "TO"
         )
     ):
         return "bare_infinitive"
@@ -896,20 +1720,21 @@ def get_chunk_types(token, all_tokens):
 #    return None
 
 
-def get_chunk_types_and_pos(token, all_tokens):
+def get_chunk_types_and_pos(token, all_tokens, index: TokenIndex = None):
+    index = index or TokenIndex(all_tokens)
 
-    form_type = get_chunk_types(token, all_tokens)
+    form_type = get_chunk_types(token, all_tokens, index)
 
     dep = token.get("dep")
     head_idx = token.get("head_idx")
-    head_token = next((t for t in all_tokens if t["idx"] == head_idx), None)
+    head_token = index.get(head_idx)
     head_dep = head_token.get("dep")
 
 
     if form_type == "subordinate_clause":
         token["role2"] = "subordinate_clause"
 
-        head_children = [t for t in all_tokens if t.get("head_idx") == head_token["idx"]]
+        head_children = index.children_of(head_token["idx"])
         print(head_children)
 
         if head_dep in {"nsubj", "csubj", "ccomp", "obj", "dobj"}:
@@ -940,7 +1765,7 @@ def get_chunk_types_and_pos(token, all_tokens):
         token["role2"] = "to_infinitive"
 
         head_idx = token.get("head_idx")
-        head_token = next((t for t in all_tokens if t["idx"] == head_idx), None)
+        head_token = index.get(head_idx)
         head_dep = head_token.get("dep") if head_token else None
 
         if head_dep in {"csubj"}:
@@ -961,28 +1786,30 @@ def get_chunk_types_and_pos(token, all_tokens):
 #    return None  # 해당사항 없으면 None
 
 
-def assign_chunks_role23(parsed):
+def assign_chunks_role23(parsed, index: TokenIndex = None):
+    index = index or TokenIndex(parsed)
     for token in parsed:
         level = token.get("level")
         if not (isinstance(level, float) and level % 1 == 0.5):
             continue  # ⬅️ 덩어리 시작요소만 처리
 
-        chunk_pos = get_chunk_types_and_pos(token, parsed)
+        chunk_pos = get_chunk_types_and_pos(token, parsed, index)
 
         if chunk_pos:
             token["role3"] = chunk_pos
 
 
-def assign_chunk_se_and_drawsymbols(parsed):
+def assign_chunk_se_and_drawsymbols(parsed, ctx):
 
     all_subject_complements = {
         "noun subject complement", "adjective subject complement"
     }
 
-    assign_chunks_role23(parsed)
+    index = ctx.index or TokenIndex(parsed)
+    assign_chunks_role23(parsed, index)
 
-    line_length = memory["sentence_length"]
-    symbols_by_level = memory["symbols_by_level"]
+    line_length = ctx.sentence_length
+    grid = ctx.symbols_by_level
 
     # 계층시작요소(level x.5단어)가 아니면 루프 빠져 나감
     for token in parsed:
@@ -992,7 +1819,7 @@ def assign_chunk_se_and_drawsymbols(parsed):
 
         #계층시작요소의 헤드 값이 없으면 루프 빠져 나감
         head_idx = token.get("head_idx")
-        head_token = next((t for t in parsed if t["idx"] == head_idx), None)
+        head_token = index.get(head_idx)
         if not head_token:
             continue
 
@@ -1029,21 +1856,21 @@ def assign_chunk_se_and_drawsymbols(parsed):
             # 계층시작요소의 유효한 head 찾아서 head값이 없으면 루프 빠져나감
             # to부정사(to infinitive)인 경우만 head의 head로 타고 올라가기
             head2_token = (
-                next((t for t in parsed if t["idx"] == head_token.get("head_idx")), None)
+                index.get(head_token.get("head_idx"))
                 if token_role3 in {"subclause_noun", "to.R_noun"}
                 else head_token
             )
             if not head2_token:
                 continue
 
-            # 계층시작요소 head의 head인 상위동사(head2) lemma값 저장
-            head2_lemma = head2_token.get("lemma", "")
+            # 계층시작요소 head의 head인 상위동사(head2) 사전 bitflag
+            head2_lex = index.lex_of(head2_token)
 
             # 1) 명사덩어리 확정후 상위동사가 be동사와 LinkingVerbs인데,
             # 상위동사(현토큰 헤드의 헤드)가 이미 명사보어, 형용사보어를 가지고 있지 않을경우 보어 확정
             # 명사덩어리 첫단어의 role1에 'noun subject complement'(명사주어보어)값 저장
             if (
-                head2_lemma in beVerbs or head2_lemma in notbeLinkingVerbs_onlySVC
+                head2_lex & (LEX["beVerbs"] | LEX["notbeLinkingVerbs_onlySVC"])
             ) and not any(
                 c.get("role1") in {"all_subject_complements"}
                 for c in head2_token.get("combine", [])
@@ -1053,7 +1880,7 @@ def assign_chunk_se_and_drawsymbols(parsed):
             # 2) 상위동사가 dativeVerbs일때 상위동사level 단어들의 role1에 objedct, indirect object가 있으면
             # 명사덩어리 첫단어의 role1에 'direct object'(직접목적어)값 저장
             # 아니면 role1에 'object'(목적어)값 저장
-            elif head2_lemma in dativeVerbs:
+            elif head2_lex & LEX["dativeVerbs"]:
                 current_level = int(level)  # x.5 -> x
                 # 현재 레벨의 토큰들
                 level_tokens = [t for t in parsed if int(t.get("level", -1)) == current_level]
@@ -1072,7 +1899,7 @@ def assign_chunk_se_and_drawsymbols(parsed):
 
 
         # ✅ # 현토큰의 head의 children들 모음 (끝 토큰 찾기 + 시작 토큰 info)
-        children_tokens = [child for child in parsed if child.get("head_idx") == head_idx]
+        children_tokens = list(index.children_of(head_idx))
         children_tokens.append(head_token)              # 현토큰의 head token까지 병합
         children_tokens.sort(key=lambda x: x["idx"])    # 단어들의 순서를 왼쪽부터 정렬함
         end_token = children_tokens[-1]
@@ -1091,7 +1918,7 @@ def assign_chunk_se_and_drawsymbols(parsed):
         int_level = int(level) # .5요소이지만 덩어리 끝표시를 상위계층에 맞추어 그려야 하므로 소수점(.5)버림
 
         role1 = token.get("role1")
-        line = symbols_by_level.setdefault(int_level, [" " for _ in range(line_length)])
+        grid.ensure(int_level)
 
         chunk_end_mark = None
 
@@ -1103,59 +1930,57 @@ def assign_chunk_se_and_drawsymbols(parsed):
 #        if 0 <= start_idx < line_length:
 #            line[start_idx] = left
         if chunk_end_mark and (0 <= end_idx_adjusted < line_length) and token.get("pos") != "VERB":
-            line[end_idx_adjusted] = chunk_end_mark
+            grid.put(int_level, end_idx_adjusted, chunk_end_mark)
 
         # ✅ to infinitive → to.o...R
         if token.get("role2") == "to_infinitive":
             verb_token = next(
-                (t for t in parsed
-                 if t["idx"] > start_idx and
-                    int(t.get("level", 0)) == int_level + 1 and
+                (t for t in index.after(start_idx)
+                 if int(t.get("level", 0)) == int_level + 1 and
                     t.get("pos") == "VERB"),
                 None
             )
             if verb_token:
                 verb_idx = verb_token["idx"]
                 verb_end = verb_idx + len(verb_token["text"]) - 1
-                line2 = symbols_by_level.setdefault(int_level + 1, [" " for _ in range(line_length)])
-                if 0 <= start_idx < line_length: line2[start_idx] = "t"
-                if 0 <= start_idx + 1 < line_length: line2[start_idx + 1] = "o"
-                for i in range(start_idx + 2, verb_end):
-                    if 0 <= i < line_length and line2[i] == " ":
-                        line2[i] = "."
-                if 0 <= verb_end < line_length: line2[verb_end] = "R"
+                lvl2 = int_level + 1
+                grid.ensure(lvl2)
+                if 0 <= start_idx < line_length: grid.put(lvl2, start_idx, "t")
+                if 0 <= start_idx + 1 < line_length: grid.put(lvl2, start_idx + 1, "o")
+                grid.fill_blank(lvl2, start_idx + 2, verb_end, ".")
+                if 0 <= verb_end < line_length: grid.put(lvl2, verb_end, "R")
 
         # ✅ gerund → R...ing
         if token.get("role2") == "gerund":
             verb_token = next(
-                (t for t in parsed
-                 if t["idx"] >= start_idx
-                    and (t.get("level") == level or int(t.get("level", 0)) == int_level + 1)
+                (t for t in index.starting_at(start_idx)
+                 if (t.get("level") == level or int(t.get("level", 0)) == int_level + 1)
                     and t.get("pos") == "VERB"),
                 None
             )
             if verb_token:
                 verb_idx = verb_token["idx"]
                 verb_end = verb_idx + len(verb_token["text"]) - 1
-                line2 = symbols_by_level.setdefault(int_level + 1, [" " for _ in range(line_length)])
-                if 0 <= start_idx < line_length: line2[start_idx] = "R"
-                for i in range(start_idx + 1, verb_end-2):
-                    if 0 <= i < line_length and line2[i] == " ":
-                        line2[i] = "."
-                if 0 <= verb_end < line_length: line2[verb_end-2] = "i"
-                if 0 <= verb_end < line_length: line2[verb_end-1] = "n"
-                if 0 <= verb_end < line_length: line2[verb_end] = "g"
+                lvl2 = int_level + 1
+                grid.ensure(lvl2)
+                if 0 <= start_idx < line_length: grid.put(lvl2, start_idx, "R")
+                grid.fill_blank(lvl2, start_idx + 1, verb_end - 2, ".")
+                if 0 <= verb_end < line_length:
+                    grid.put(lvl2, verb_end - 2, "i")
+                    grid.put(lvl2, verb_end - 1, "n")
+                    grid.put(lvl2, verb_end, "g")
 
     return parsed
     
 
-def apply_subject_adverb_chunk_range_symbol(parsed):
+def apply_subject_adverb_chunk_range_symbol(parsed, ctx):
     """
     role3=chunk_subject인 토큰을 기준으로
     해당 절(start_idx ~ end_idx) 범위에 [ ] 심볼 부여
     """
-    line_length = memory["sentence_length"]
-    symbols_by_level = memory["symbols_by_level"]
+    line_length = ctx.sentence_length
+    grid = ctx.symbols_by_level
+    index = ctx.index or TokenIndex(parsed)
 
     for token in parsed:
         role1 = token.get("role1")
@@ -1166,16 +1991,17 @@ def apply_subject_adverb_chunk_range_symbol(parsed):
         if level is None:
             continue
 
-        line = symbols_by_level.setdefault(int(level), [" " for _ in range(line_length)])
+        lvl = int(level)
+        grid.ensure(lvl)
 
         start_idx = token["idx"]
         head_idx = token.get("head_idx")
-        head_token = next((t for t in parsed if t["idx"] == head_idx), None)
+        head_token = index.get(head_idx)
 
         if not head_token:
             continue
 
-        children_tokens = [child for child in parsed if child.get("head_idx") == head_idx]
+        children_tokens = list(index.children_of(head_idx))
         children_tokens.append(head_token)
         if not children_tokens:
             continue
@@ -1210,16 +2036,17 @@ def apply_subject_adverb_chunk_range_symbol(parsed):
             continue
 
         if 0 <= start_idx < line_length:
-            line[start_idx] = left
+            grid.put(lvl, start_idx, left)
         if 0 <= end_idx_adjusted < line_length:
-            line[end_idx_adjusted] = right
+            grid.put(lvl, end_idx_adjusted, right)
 
 
-def NounChunk_combine_apply_to_upverb(parsed):
+def NounChunk_combine_apply_to_upverb(parsed, index: TokenIndex = None):
     """
     명사덩어리 첫단어 role2가 object / direct object / noun subject complement일때
     상위 동사의 comnbin에 role2를 입력해주는 함수
     """
+    index = index or TokenIndex(parsed)
     for token in parsed:
         role2 = token.get("role2")
         # 명사덩어리 첫단어의 role2가 이 3개일때만 아래 소스 처리
@@ -1231,13 +2058,13 @@ def NounChunk_combine_apply_to_upverb(parsed):
 
         # 명사덩어리 첫단어의 head(보통 동사)의 dep가 ccomp(종속접속사)일때만 아래 소스 처리
         head_idx = token.get("head_idx")
-        head_token = next((t for t in parsed if t["idx"] == head_idx), None)
+        head_token = index.get(head_idx)
         if not head_token or head_token.get("dep") not in {"ccomp", "xcomp"}:
             continue
 
         # 명사덩어리 첫단어의 head의 head(상위 동사 head2)가 있으면 아래 소스 처리리
         head2_idx = head_token.get("head_idx")
-        head2_token = next((t for t in parsed if t["idx"] == head2_idx), None)
+        head2_token = index.get(head2_idx)
         if not head2_token:
             continue
         if "combine" not in head2_token or not head2_token["combine"]:
@@ -1251,22 +2078,16 @@ def NounChunk_combine_apply_to_upverb(parsed):
         })
 
 
-# 아무 심볼도 안 찍힌 줄이면 memory에서 아예 제거
-def clean_empty_symbol_lines():
+# 아무 심볼도 안 찍힌 줄이면 ctx에서 아예 제거
+def clean_empty_symbol_lines(ctx):
     """
-    memory["symbols_by_level"] 중 내용이 전부 공백인 줄은 제거한다.
+    ctx.symbols_by_level 중 내용이 전부 공백인 줄은 제거한다.
     """
-    keys_to_remove = []
-    for level, line in memory["symbols_by_level"].items():
-        if all(c == " " for c in line):
-            keys_to_remove.append(level)
-
-    for level in keys_to_remove:
-        del memory["symbols_by_level"][level]
+    ctx.symbols_by_level.drop_blank_rows()
 
 
 # 동사덩어리(verb chain) 하나 받아서 시제/상/태 분석하고 symbol_map 반환하는 함수.
-def set_verbchunk_attributes(chain):
+def set_verbchunk_attributes(chain, ctx):
 
     symbol_map = {}
     aspect = []
@@ -1275,20 +2096,20 @@ def set_verbchunk_attributes(chain):
     if not chain:
         return symbol_map, aspect, voice
 
-    verb_attr = memory["symbols_all"]["verb_attr"]
+    verb_attr = ctx.symbols_all["verb_attr"]
 
     # 맨 앞 토큰
     first = chain[0]
-    first_lemma = first.get("lemma", "").lower()
+    first_lex = (ctx.index or TokenIndex(chain)).lex_of(first)
     first_pos = first.get("pos")
     first_dep = first.get("dep")
     first_tag = first.get("tag")
 
     # ✅ P1. 맨앞 modal 여부
     if first_pos == "AUX" and first_dep == "aux" and first_tag == "MD":
-        if first_lemma in modalVerbs_present:
+        if first_lex & LEX["modalVerbs_present"]:
             symbol_map[first["idx"]] = verb_attr["present tense"]
-        elif first_lemma in modalVerbs_past:
+        elif first_lex & LEX["modalVerbs_past"]:
             symbol_map[first["idx"]] = verb_attr["past tense"]
 
     # ✅ P2. 중간 조동사들 처리
@@ -1370,10 +2191,10 @@ def set_verbchunk_attributes(chain):
     return symbol_map, aspect, voice
 
 # 문장의 전체 parsed 결과를 받아 동사덩어리별 시제/상/태 분석.
-def set_allverbchunk_attributes(parsed):
-    memory["verb_attribute_by_chain"] = []
-    memory["verb_attribute"] = {}
-    sentence_len = memory["sentence_length"]
+def set_allverbchunk_attributes(parsed, ctx):
+    ctx.verb_attribute_by_chain = []
+    ctx.verb_attribute = {}
+    sentence_len = ctx.sentence_length
 
     chains = []
     current_chain = []
@@ -1419,10 +2240,10 @@ def set_allverbchunk_attributes(parsed):
         first = chain[0]
         last = chain[-1]
 
-        symbol_map, aspect, voice = set_verbchunk_attributes(chain)
+        symbol_map, aspect, voice = set_verbchunk_attributes(chain, ctx)
 
         # 저장 (디버깅용, 확장용)
-        memory["verb_attribute_by_chain"].append({
+        ctx.verb_attribute_by_chain.append({
             "aspect": aspect,
             "voice": voice,
             "main_verb": chain[-1]["text"],
@@ -1432,7 +2253,7 @@ def set_allverbchunk_attributes(parsed):
 
         all_symbol_maps.update(symbol_map)
 
-    memory["verb_attribute"] = {
+    ctx.verb_attribute = {
         "symbol_map": all_symbol_maps,
         "main_verb": last["text"],
         "aspect": aspect,
@@ -1440,55 +2261,304 @@ def set_allverbchunk_attributes(parsed):
     }
 
 # ◎ GPT 프롬프트 처리 함수
-def spacy_parsing_backgpt(sentence: str, force_gpt: bool = False):
+# spaCy Doc → 규칙 엔진이 쓰는 토큰 테이블(list of dict) 변환
+_UNSET = object()
 
-#    memory["used_gpt"] = False  # ✅ 기본값: GPT 미사용
-    doc = nlp(sentence)
 
-    prompt = f"""
+# 토큰 객체를 예전 토큰 dict처럼 쓰게 해주는 공통 부분 (TokenRecord, DocToken)
+class TokenAccess:
+    __slots__ = ()
+
+    BASE_FIELDS = ("idx", "text", "pos", "tag", "dep", "head", "head_idx", "lemma", "is_punct", "is_alpha")
+    RULE_FIELDS = ("role1", "role2", "role3", "level", "combine", "children")
+    LAZY_FIELDS = ("is_title", "ent_type", "is_stop")
+    DERIVED_FIELDS = ("morph", "tense", "aspect", "voice", "form") + LAZY_FIELDS
+
+    def _known(self, key) -> bool:
+        return key in KNOWN_TOKEN_FIELDS
+
+    def get(self, key, default=None):
+        if key not in KNOWN_TOKEN_FIELDS:  # 도식/규칙 단계에서 가장 많이 불리는 곳이라 메서드 호출 없이 검사
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        if key not in KNOWN_TOKEN_FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in TokenAccess.RULE_FIELDS and key not in TokenAccess.BASE_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        return self._known(key) and hasattr(self, key)
+
+    def to_dict(self) -> dict:
+        """예전 토큰 dict 모양 (children/규칙 필드는 있는 것만)"""
+        out = {field: getattr(self, field) for field in TokenAccess.BASE_FIELDS + TokenAccess.DERIVED_FIELDS}
+        for field in TokenAccess.RULE_FIELDS:
+            if hasattr(self, field):
+                out[field] = getattr(self, field)
+        return out
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+KNOWN_TOKEN_FIELDS = frozenset(TokenAccess.BASE_FIELDS + TokenAccess.RULE_FIELDS + TokenAccess.DERIVED_FIELDS)
+
+
+# ◎ 토큰 1개 레코드 : 토큰마다 dict(+morph dict, children 글자 목록)를 만들던 것을 __slots__ 객체로 대체
+class TokenRecord(TokenAccess):
+    """
+    규칙 단계는 예전 dict처럼 t.get("role1"), t["level"] = 1, "combine" in t 로 그대로 쓴다.
+    - morph : "Tense=Past|VerbForm=Fin" 문자열 1개로 들고 있다가 읽을 때 dict로 풀어줌
+    - is_title / ent_type / is_stop : 거의 안 쓰므로 spaCy 토큰에서 필요할 때 계산 (detach() 후엔 저장된 값)
+    - role1~3 / level / combine / children : 규칙 단계가 채우기 전엔 없는 키 (get()은 None/기본값)
+    """
+    __slots__ = TokenAccess.BASE_FIELDS + TokenAccess.RULE_FIELDS + ("morph_str", "_token", "_is_title", "_ent_type", "_is_stop")
+
+    idx: int
+    text: str
+    pos: str
+    tag: str
+    dep: str
+    head: str
+    head_idx: int
+    lemma: str
+    is_punct: bool
+    is_alpha: bool
+    morph_str: str
+    role1: Optional[str]
+    role2: Optional[str]
+    role3: Optional[str]
+    level: Optional[float]
+    combine: Optional[list]
+    children: list
+
+    @classmethod
+    def from_token(cls, token) -> "TokenRecord":
+        rec = cls.__new__(cls)
+        rec.idx = token.idx
+        rec.text = token.text
+        rec.pos = token.pos_
+        rec.tag = token.tag_
+        rec.dep = token.dep_.lower()
+        rec.head = token.head.text
+        rec.head_idx = token.head.idx
+        rec.lemma = token.lemma_
+        rec.is_punct = token.is_punct
+        rec.is_alpha = token.is_alpha
+        rec.morph_str = str(token.morph)
+        rec._token = token
+        rec._is_title = rec._ent_type = rec._is_stop = _UNSET
+        return rec
+
+    def copy(self, detach: bool = False) -> "TokenRecord":
+        """규칙 단계가 고쳐도 되는 복사본. detach=True면 spaCy 토큰(→ Doc) 참조를 끊는다 (캐시 보관용)"""
+        rec = TokenRecord.__new__(TokenRecord)
+        for field in TokenRecord.__slots__:
+            value = getattr(self, field, _UNSET)
+            if value is not _UNSET:
+                setattr(rec, field, list(value) if field in ("combine", "children") else value)
+        if detach:
+            rec._is_title, rec._ent_type, rec._is_stop = self.is_title, self.ent_type, self.is_stop
+            rec._token = None
+        return rec
+
+    # 필요할 때만 계산하는 필드들
+    @property
+    def morph(self) -> dict:
+        if not self.morph_str:
+            return {}
+        return dict(feat.split("=", 1) for feat in self.morph_str.split("|"))
+
+    @property
+    def tense(self):
+        return self.morph.get("Tense")
+
+    @property
+    def aspect(self):
+        return self.morph.get("Aspect")
+
+    @property
+    def voice(self):
+        return self.morph.get("Voice")
+
+    @property
+    def form(self):
+        return self.morph.get("VerbForm")
+
+    @property
+    def is_title(self) -> bool:
+        if self._is_title is _UNSET:
+            self._is_title = self._token.is_title
+        return self._is_title
+
+    @property
+    def ent_type(self) -> str:
+        if self._ent_type is _UNSET:
+            self._ent_type = self._token.ent_type_
+        return self._ent_type
+
+    @property
+    def is_stop(self) -> bool:
+        if self._is_stop is _UNSET:
+            self._is_stop = self._token.is_stop
+        return self._is_stop
+
+
+
+# ◎ Doc 직접 사용 모드 (TOKEN_TABLE_ENGINE=doc) : 토큰 테이블을 만들지 않고 spaCy Doc 위에서 규칙 단계를 돌린다.
+#    기본 필드는 spaCy 토큰에서 바로 읽고, 규칙 결과는 Token._ 확장 속성에 저장 → 분석이 끝난 Doc을 그대로 넘겨줄 수 있음
+#    (token._.role1, token._.level, token._.combine, token._.child_idx ...)
+DOC_EXTENSIONS = {"role1": "role1", "role2": "role2", "role3": "role3", "level": "level", "combine": "combine", "children": "child_idx"}
+for _ext in DOC_EXTENSIONS.values():
+    Token.set_extension(_ext, default=None, force=True)
+
+
+def _from_token(getter):
+    return property(lambda self: getter(self._token))
+
+
+def _from_extension(field, absent_when_none=False):
+    name = DOC_EXTENSIONS[field]
+
+    def fget(self):
+        value = self._token._.get(name)
+        if value is None and absent_when_none:
+            raise AttributeError(field)  # dict에 키가 없던 것과 같게 (get("combine", []) 등)
+        return value
+
+    def fset(self, value):
+        self._token._.set(name, value)
+
+    return property(fget, fset)
+
+
+class DocToken(TokenAccess):
+    """spaCy 토큰 위의 얇은 view. 복사하는 필드 없음 (객체당 토큰 참조 1개)"""
+    __slots__ = ("_token",)
+
+    def __init__(self, token):
+        self._token = token
+
+    idx = _from_token(lambda t: t.idx)
+    text = _from_token(lambda t: t.text)
+    pos = _from_token(lambda t: t.pos_)
+    tag = _from_token(lambda t: t.tag_)
+    dep = _from_token(lambda t: t.dep_.lower())
+    head = _from_token(lambda t: t.head.text)
+    head_idx = _from_token(lambda t: t.head.idx)
+    lemma = _from_token(lambda t: t.lemma_)
+    is_punct = _from_token(lambda t: t.is_punct)
+    is_alpha = _from_token(lambda t: t.is_alpha)
+    is_title = _from_token(lambda t: t.is_title)
+    ent_type = _from_token(lambda t: t.ent_type_)
+    is_stop = _from_token(lambda t: t.is_stop)
+    morph = _from_token(lambda t: t.morph.to_dict())
+    tense = property(lambda self: self.morph.get("Tense"))
+    aspect = property(lambda self: self.morph.get("Aspect"))
+    voice = property(lambda self: self.morph.get("Voice"))
+    form = property(lambda self: self.morph.get("VerbForm"))
+
+    # level/combine은 예전 dict에서 None으로 저장되는 일이 없으므로 None = 아직 없는 키
+    role1 = _from_extension("role1")
+    role2 = _from_extension("role2")
+    role3 = _from_extension("role3")
+    level = _from_extension("level", absent_when_none=True)
+    combine = _from_extension("combine", absent_when_none=True)
+    children = _from_extension("children")
+
+
+def doc_to_tokens(doc) -> list:
+    return [TokenRecord.from_token(token) for token in doc]
+
+
+def doc_view(doc) -> list:
+    return [DocToken(token) for token in doc]
+
+
+# spaCy 토큰 → 예전 토큰 dict 모양 (/parse 응답, 메모리 비교용). dep은 spaCy 라벨 그대로 (ROOT 포함)
+def token_to_dict(token) -> dict:
+    morph = token.morph.to_dict()
+    return {
+        "idx": token.idx, "text": token.text, "pos": token.pos_, "tag": token.tag_,
+        "dep": token.dep_, "head": token.head.text, "head_idx": token.head.idx,
+        "tense": morph.get("Tense"), "aspect": morph.get("Aspect"), "form": morph.get("VerbForm"),
+        "voice": morph.get("Voice"), "morph": morph, "lemma": token.lemma_,
+        "is_stop": token.is_stop, "is_punct": token.is_punct, "is_alpha": token.is_alpha,
+        "ent_type": token.ent_type_, "is_title": token.is_title,
+        "children": [child.text for child in token.children]
+    }
+
+
+# 규칙 단계가 토큰을 직접 고치므로, 캐시에 보관한 원본 테이블은 복사해서 넘겨준다.
+def copy_token_table(tokens: list, detach: bool = False) -> list:
+    return [t.copy(detach) for t in tokens]
+
+
+# 토큰 테이블 캐시 크기 계산용 (예전 dict 모양 JSON 크기 기준)
+def token_table_size(tokens: list) -> int:
+    return len(json.dumps([t.to_dict() for t in tokens], ensure_ascii=False, default=str).encode("utf-8"))
 
-"""
-    # spaCy에서 토큰 데이터 추출
-    tokens = []
-    for token in doc:
-        morph = token.morph.to_dict()
-        tokens.append({
-            "idx": token.idx, "text": token.text, "pos": token.pos_,"tag": token.tag_,
-            "dep": token.dep_.lower(), "head": token.head.text, "head_idx": token.head.idx,
-            "tense": morph.get("Tense"), "aspect": morph.get("Aspect"), "voice": morph.get("Voice"), "form": morph.get("VerbForm"),
-            "morph": morph, "lemma": token.lemma_, "is_stop": token.is_stop,
-            "is_punct": token.is_punct, "is_alpha": token.is_alpha, "ent_type": token.ent_type_,
-            "is_title": token.is_title, "children": [child.text for child in token.children]
-        })
+
+def spacy_parsing_backgpt(sentence: str, ctx: AnalysisContext, force_gpt: bool = False, doc=None, tokens=None,
+                          use_doc_view: bool = None):
+
+#    ctx.used_gpt = False  # ✅ 기본값: GPT 미사용 (AnalysisContext 생성시 설정됨)
+    # tokens(캐시된 토큰 테이블)나 doc(nlp.pipe로 미리 파싱한 Doc)이 넘어오면 그대로 사용
+    if use_doc_view is None:
+        use_doc_view = TOKEN_TABLE_ENGINE == "doc"
+    if tokens is None:
+        if doc is None:
+            doc = nlp(sentence)
+        # spaCy에서 토큰 데이터 추출 (doc 모드면 복사 없이 Doc 위의 view)
+        tokens = doc_view(doc) if use_doc_view else doc_to_tokens(doc)
+    ctx.doc = doc
+
+    # 토큰 인덱스 (idx→토큰, head→자식, 순번) : 1번만 만들어서 모든 규칙 단계가 공유
+    index = TokenIndex(tokens)
+    ctx.index = index
+    if RULE_MATCHER_ENGINE:
+        index.matches = RuleMatches(doc if doc is not None else doc_from_tokens(tokens), rule_matchers_for(index.lexicon))
+
+    # 열 방식 토큰 테이블 (TOKEN_TABLE_ENGINE=columnar 일 때만)
+    columns = None
+    if TOKEN_TABLE_ENGINE == "columnar":
+        columns = TokenColumns.from_doc(doc) if doc is not None else TokenColumns.from_tokens(tokens, index)
+        columns.lexicon = index.lexicon
 
     # 규칙 기반 파싱
-    parsed = rule_based_parse(tokens)
+    parsed = rule_based_parse(tokens, index, columns)
 
     # ✅ 보어 형용사 보정: ADJ인데 object로 된 경우
-    parsed = assign_adj_object_complement_when_compound_object(parsed)
+    parsed = rule_passes.run(assign_adj_object_complement_when_compound_object, parsed, index)
 
     # ✅ 보어 기준으로 object를 복원 (compound인 경우 등)
-    parsed = repair_object_from_complement(parsed)
+    parsed = rule_passes.run(repair_object_from_complement, parsed, index)
 
     # ✅ NEW: advcl+ADJ 보어 보정
-    parsed = assign_adj_complement_for_advcl_adjective(parsed)
+    parsed = rule_passes.run(assign_adj_complement_for_advcl_adjective, parsed, index)
 
     # SVOO 관련 보정(indirect object role만 있는 경우)
-    parsed = recover_direct_object_from_indirect(parsed)
+    parsed = rule_passes.run(recover_direct_object_from_indirect, parsed, index)
 
 
     # level 분기 전파
-    parsed = assign_level_trigger_ranges(parsed)
+    parsed = rule_passes.run(assign_level_trigger_ranges, parsed, index)
 
     # ✅ 요기! 모든 보정 끝난 후에 combine 추론
-    for t in parsed:
-        combine = guess_combine(t, parsed)
-        if combine:
-            t["combine"] = combine
+    parsed = rule_passes.run(assign_combines, parsed, index)
 
     # 조건: 규칙 기반 실패하거나, 강제로 GPT 사용 요청
     if not parsed or force_gpt:
-        memory["used_gpt"] = True  # ✅ GPT fallback 사용된 경우
+        ctx.used_gpt = True  # ✅ GPT fallback 사용된 경우
         # GPT 파싱 호출
         prompt = gpt_parsing_withprompt(tokens)  # 아래 2단계에서 만들 예정
 
@@ -1509,15 +2579,15 @@ def spacy_parsing_backgpt(sentence: str, force_gpt: bool = False):
             print("[RAW CONTENT]", content if 'content' in locals() else '[No response]')
             return []
 
-    assign_chunk_se_and_drawsymbols(parsed)  # ★★★★ 위의 assign_level_trigger_ranges() 함수 위로 갈 수 없다.
+    assign_chunk_se_and_drawsymbols(parsed, ctx)  # ★★★★ 위의 assign_level_trigger_ranges() 함수 위로 갈 수 없다.
                                                 # 그래서 guess_combine_second()를 한번 더 호출한다.
 
     # ✅ 📍 level 보정: prep-pobj 레벨 통일
-    parsed = repair_level_within_prepositional_phrases(parsed)
+    parsed = rule_passes.run(repair_level_within_prepositional_phrases, parsed, index, columns)
 
-    parsed = guess_combine_second(parsed)
+    parsed = rule_passes.run(guess_combine_second, parsed, index)
 
-    set_allverbchunk_attributes(parsed)
+    set_allverbchunk_attributes(parsed, ctx)
 
     return parsed
 
@@ -1545,25 +2615,159 @@ If unsure, return best-guess. Do not return explanations, just the JSON.
     return prompt.strip()
 
 
-# ◎ 저장공간 초기화
-def init_memorys (sentence: str):
-#    memory["characters"] = list(sentence)        # characters에 sentence의 글자 한글자씩 채우기
-    memory["symbols_by_level"] = {}  # 문장마다 새로 초기화
-    memory["sentence_length"] = len(sentence)  # 도식 길이 추적용 (줄 길이 통일)
+# ◎ 저장공간 초기화 : 요청마다 새 AnalysisContext를 만들어 돌려준다.
+def init_memorys (sentence: str, symbols: "SymbolTable" = None) -> AnalysisContext:
+    return AnalysisContext(sentence, symbols)
+
+
+# ◎ 심볼 테이블 : 심볼 사전(분류 → 이름 → 심볼)을 로드할 때 1번 컴파일해두고 토큰마다 dict/list 조회만 한다.
+#    클라이언트별 심볼 세트(SYMBOL_SETS_PATH)도 시작할 때 기본 심볼에 덮어써서 같이 컴파일 → 요청마다 다시 만들지 않음
+#    파일 형식 : {"세트이름": {"role": {"verb": "O", ...}, "verb_attr": {...}}, ...} (바꿀 심볼만 적으면 됨)
+SYMBOL_SETS_PATH = os.getenv("SYMBOL_SETS_PATH", "")  # 비어있으면 default 세트만
+
+
+class SymbolTable:
+    """
+    - by_name : 소문자 이름 → 심볼 (예전 lookup_symbol처럼 앞 분류, 앞 key가 우선)
+    - by_role : ROLE_CODES 코드 → 심볼 (role 이름은 코드 → list 조회)
+    """
+    def __init__(self, name: str, categories: dict):
+        self.name = name
+        self.categories = categories
+        self.by_name = {}
+        for category in categories.values():
+            for key, value in category.items():
+                self.by_name.setdefault(key.lower(), value)
+        self.by_role = [self.by_name.get(role) if role else None for role in ROLE_NAMES]
+
+    def lookup(self, name: str):
+        if not name:
+            return None
+        code = ROLE_CODES.get(name)
+        if code is not None:
+            return self.by_role[code]
+        return self.by_name.get(name.lower())  # role 외 이름 (verb_attr, relatives 등)
+
+    def with_overrides(self, name: str, overrides: dict) -> "SymbolTable":
+        categories = {category: dict(entries) for category, entries in self.categories.items()}
+        for category, entries in overrides.items():
+            if not isinstance(entries, dict):
+                raise ValueError(f"symbol set {name!r}: category {category!r} must be an object")
+            for key, symbol in entries.items():
+                if not isinstance(symbol, str) or len(symbol) != 1:  # 도식은 글자 1칸 = 심볼 1개
+                    raise ValueError(f"symbol set {name!r}: {key!r} must be a single character")
+            categories.setdefault(category, {}).update(entries)
+        return SymbolTable(name, categories)
+
+
+def load_symbol_tables(path: str) -> dict:
+    tables = {"default": SymbolTable("default", symbols_all)}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for name, overrides in json.load(f).items():
+                tables[name] = tables["default"].with_overrides(name, overrides)
+    return tables
+
+
+symbol_tables = load_symbol_tables(SYMBOL_SETS_PATH)
+default_symbols = symbol_tables["default"]
 
 
 def lookup_symbol(name):
-    name = name.lower()
-    for symbol_category in symbols_all.values():
-        for key, value in symbol_category.items():
-            if key.lower() == name:
-                return value
-    return None
+    return default_symbols.lookup(name)
+
 
-# ◎ symbols 메모리에 심볼들 저장하기
-def apply_symbols(parsed):
-    symbols_by_level = memory["symbols_by_level"]
-    line_length = memory["sentence_length"]
+def line_runs(line: np.ndarray) -> list:
+    """글자 배열 1줄 → 같은 글자가 이어진 구간 [(start, end, 글자)] (공백 구간 제외, end 미포함)"""
+    if not len(line):
+        return []
+    change = np.flatnonzero(line[1:] != line[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [len(line)]))
+    return [(int(start), int(end), str(line[start])) for start, end in zip(starts, ends) if line[start] != " "]
+
+
+# ◎ 도식 격자 : level별 심볼 줄을 (줄 수 × 문장 글자 수) 글자 배열 1개에 담는다.
+#    구간 채우기는 slice + "빈칸(공백)인 곳만" mask, 출력은 배열 전체를 1번 decode.
+class DiagramGrid:
+    """
+    - level → 줄 번호. 예전 dict처럼 level 값이 그대로 key (1과 1.0은 같은 줄, 0.5 같은 x.5 level도 별도 줄)
+    - ensure(level) : 줄이 없으면 공백 줄 생성 (예전 setdefault). 출력에는 빈 줄도 그대로 나감
+    - put : 덮어쓰기 / put_blank, fill_blank : 공백인 칸만 채움 (col은 list처럼 음수면 뒤에서부터)
+    """
+    def __init__(self, width: int):
+        self.width = width
+        self.rows = {}
+        self.cells = np.full((4, width), " ", dtype="<U1")
+
+    def __contains__(self, level) -> bool:
+        return level in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def ensure(self, level) -> int:
+        row = self.rows.get(level)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.cells):
+                self.cells = np.concatenate([self.cells, np.full_like(self.cells, " ")])
+            self.rows[level] = row
+        return row
+
+    # ensure()가 배열을 늘릴 수 있으므로 줄 번호를 먼저 구한 뒤 self.cells를 읽는다
+    def put(self, level, col: int, symbol: str):
+        row = self.ensure(level)
+        self.cells[row, col] = symbol
+
+    def put_blank(self, level, col: int, symbol: str):
+        row = self.ensure(level)
+        line = self.cells[row]
+        if line[col] == " ":
+            line[col] = symbol
+
+    def fill_blank(self, level, start: int, stop: int, symbol: str):
+        """start ~ stop-1 구간의 공백 칸만 symbol로 채움"""
+        row = self.ensure(level)
+        segment = self.cells[row, max(start, 0):stop]
+        segment[segment == " "] = symbol
+
+    def line(self, level) -> str:
+        return "".join(self.cells[self.rows[level]])
+
+    def spans(self) -> list:
+        """level 오름차순 줄마다 같은 심볼이 이어진 구간 [[level, start, end, 심볼], ...] (공백 제외, end 미포함)"""
+        return [[level, start, end, symbol]
+                for level in sorted(self.rows)
+                for start, end, symbol in line_runs(self.cells[self.rows[level]])]
+
+    def copy(self) -> "DiagramGrid":
+        grid = DiagramGrid(self.width)
+        grid.rows = dict(self.rows)
+        grid.cells = self.cells.copy()
+        return grid
+
+    def drop_blank_rows(self):
+        keep = [level for level, row in self.rows.items() if (self.cells[row] != " ").any()]
+        self.cells = self.cells[[self.rows[level] for level in keep]] if keep else self.cells[:0]
+        self.rows = {level: row for row, level in enumerate(keep)}
+
+    def render(self, first_line: np.ndarray = None) -> str:
+        """(first_line +) level 오름차순 줄들을 "\n"으로 이은 문자열. 배열 1개를 만들어 1번에 decode"""
+        order = [self.rows[level] for level in sorted(self.rows)]
+        extra = 0 if first_line is None else 1
+        block = np.empty((extra + len(order), self.width + 1), dtype="<U1")
+        block[:, self.width] = "\n"
+        if extra:
+            block[0, :self.width] = first_line
+        block[extra:, :self.width] = self.cells[order]
+        return block.tobytes().decode("utf-32-le")[:-1]
+
+# ◎ symbols 저장공간(ctx)에 심볼들 저장하기
+def apply_symbols(parsed, ctx):
+    grid = ctx.symbols_by_level
+    line_length = ctx.sentence_length
+    symbols = ctx.symbols
 
     for item in parsed:
         idx = item.get("idx", -1)
@@ -1574,22 +2778,21 @@ def apply_symbols(parsed):
         if idx < 0 or level is None:
             continue
 
-        symbol1 = lookup_symbol(role1)
-        symbol2 = lookup_symbol(role2)
+        symbol1 = symbols.lookup(role1)
+        symbol2 = symbols.lookup(role2)
 
         # ✅ 1. role1: 정수 레벨에만 찍기
-        levels_role1 = [int(level)]  # <--- 여기 수정
-        for lvl in levels_role1:
-            line = symbols_by_level.setdefault(lvl, [" " for _ in range(line_length)])
-            if 0 <= idx < len(line) and line[idx] == " " and symbol1:
-                line[idx] = symbol1
+        lvl = int(level)
+        grid.ensure(lvl)
+        if 0 <= idx < line_length and symbol1:
+            grid.put_blank(lvl, idx, symbol1)
 
         # ✅ 2. role2: (0.5 레벨 단어에만)
         if isinstance(level, float) and (level % 1 == 0.5):
             lvl_role2 = int(level) + 1
-            line2 = symbols_by_level.setdefault(lvl_role2, [" " for _ in range(line_length)])
-            if 0 <= idx < len(line2) and line2[idx] == " " and symbol2:
-                line2[idx] = symbol2
+            grid.ensure(lvl_role2)
+            if 0 <= idx < line_length and symbol2:
+                grid.put_blank(lvl_role2, idx, symbol2)
 
     # ⬇️ combine 연결선을 _ 로 그려줌!
     for item in parsed:
@@ -1606,38 +2809,33 @@ def apply_symbols(parsed):
                 continue
 
             lvl = int(level + 0.5)
-
-            line = symbols_by_level.setdefault(lvl, [" " for _ in range(line_length)])
             start = min(idx1, idx2)
             end = max(idx1, idx2)
-
-            for i in range(start + 1, end):
-                if line[i] == " ":
-                    line[i] = "_"
+            grid.fill_blank(lvl, start + 1, end, "_")
 
     return parsed
 
 
 # 처음 나오는 조동사와 본동사 사이를 .(점)으로 연결 시켜줌, 레벨 순회하며(다른 레벨간 연결할일 없음), 기존 도형 있으면 안찍음
-def apply_aux_to_mverb_bridge_symbols_each_levels(parsed, sentence):
+def apply_aux_to_mverb_bridge_symbols_each_levels(parsed, sentence, ctx):
+    index = ctx.index or TokenIndex(parsed)
 
     for modal_token in [t for t in parsed if t["pos"] == "AUX" and t["dep"] in {"aux", "auxpass"}]:
         level = modal_token.get("level")
         if level is None:
             continue
 
-        line = memory["symbols_by_level"].get(level)
-        if not line:
+        grid = ctx.symbols_by_level
+        if level not in grid or not grid.width:  # 그 level 줄이 아직 없으면 안 그림
             continue
 
         modal_idx = modal_token["idx"]
 
         # ✅ 조동사 이후에 나오는 첫 번째 본동사(verb role)
         verb_token = next(
-            (t for t in parsed
+            (t for t in index.after(modal_idx)
              if t.get("role1") == "verb"
-             and t.get("level") == level
-             and t["idx"] > modal_idx),
+             and t.get("level") == level),
             None
         )
         if not verb_token:
@@ -1646,28 +2844,24 @@ def apply_aux_to_mverb_bridge_symbols_each_levels(parsed, sentence):
         verb_idx = verb_token["idx"]
         start, end = sorted([modal_idx, verb_idx])
 
-        # ✅ 의문문 판단
+        # ✅ 의문문 판단 (조동사와 본동사 사이에 주어가 있는지)
         has_subject_between = any(
-            t.get("role1") == "subject" and start < t["idx"] < end
-            for t in parsed
+            t.get("role1") == "subject"
+            for t in index.between(start, end)[1:-1]
         )
 
         if has_subject_between:
-            if line[modal_idx] == " ":
-                line[modal_idx] = "∩"
+            grid.put_blank(level, modal_idx, "∩")
         else:
-            if line[modal_idx] == " ":
-                line[modal_idx] = "."
+            grid.put_blank(level, modal_idx, ".")
 
-        for i in range(start + 1, end):
-            if line[i] == " ":
-                line[i] = "."
+        grid.fill_blank(level, start + 1, end, ".")
 
 
 # 동일레벨, 같은 절에 동사가 여러개 병렬 나열된 경우 동사덩어리 처음 요소와 끝요소를 .(점)으로 채워줌
-def draw_dot_bridge_across_verb_group(parsed):
-    line_length = memory["sentence_length"]
-    symbols_by_level = memory["symbols_by_level"]
+def draw_dot_bridge_across_verb_group(parsed, ctx):
+    grid = ctx.symbols_by_level
+    index = ctx.index or TokenIndex(parsed)
     visited = set()
 
     for token in parsed:
@@ -1686,90 +2880,124 @@ def draw_dot_bridge_across_verb_group(parsed):
         idx1 = token["idx"]
         idx2 = None
 
-        for t in parsed:
+        # idx1 ~ t 사이(양끝 제외)에 같은 level 주어가 있었는지 : 앞으로 훑으면서 갱신 (후보마다 구간을 다시 보지 않음)
+        has_subject_between = False
+        for t in index.after(idx1):
+            t_level = t.get("level")
             if (
-                t["idx"] > idx1 and
-                t.get("level") == level and
+                t_level == level and
                 t.get("pos") in {"VERB", "AUX"} and
                 t.get("dep", "").lower() in {"root", "conj", "xcomp", "ccomp"}
             ):
-                has_subject_between = any(
-                    s.get("role1") == "subject" and
-                    s.get("level") == level and
-                    idx1 < s["idx"] < t["idx"]
-                    for s in parsed
-                )
                 if has_subject_between:
                     break
                 idx2 = t["idx"]
+            if t_level == level and t.get("role1") == "subject":
+                has_subject_between = True
 
         if idx2 and (idx1, idx2) not in visited:
             visited.add((idx1, idx2))
-            line = symbols_by_level.setdefault(level, [" " for _ in range(line_length)])
-            for i in range(idx1 + 1, idx2):
-                if line[i] == " ":
-                    line[i] = "."
-
+            grid.fill_blank(level, idx1 + 1, idx2, ".")  # level이 x.5면 x.5 줄이 따로 생김
 
-# ◎ memory["symbols"] 내용을 출력하기 위해 만든 함수
-def symbols_to_diagram(sentence: str):
-    output_lines = []
 
-    line_length = memory["sentence_length"]
-    parsed = memory.get("parsed")
+# 도식 마무리 (출력 직전 단계) : 조동사 bridge를 그리고 시제/상/태 줄을 만들어 돌려준다.
+def finish_diagram(sentence: str, ctx: AnalysisContext) -> np.ndarray:
+    line_length = ctx.sentence_length
+    parsed = ctx.parsed
 
-    # ✅ 새 방식으로 시제/상/태 symbol map 출력
-    tav_line = [" " for _ in range(line_length)]
-    symbol_map = memory.get("verb_attribute", {}).get("symbol_map", {})
+    # ✅ 새 방식으로 시제/상/태 symbol map 출력 (첫 줄)
+    tav_line = np.full(line_length, " ", dtype="<U1")
+    symbol_map = ctx.verb_attribute.get("symbol_map", {})
     for idx, symbol in symbol_map.items():
         if 0 <= idx < line_length:
             tav_line[idx] = symbol
-    output_lines.append("".join(tav_line))  # ← 첫 줄로 출력
-
-    # ✅ 문장 텍스트 줄
-    output_lines.append(sentence)
 
     # ✅ bridge(∩) 및 ○□ 심볼 출력
     if parsed:
-        apply_aux_to_mverb_bridge_symbols_each_levels(parsed, sentence)
+        apply_aux_to_mverb_bridge_symbols_each_levels(parsed, sentence, ctx)
 
-#   clean_empty_symbol_lines()
+#   clean_empty_symbol_lines(ctx)
+    return tav_line
 
-    for level in sorted(memory["symbols_by_level"]):
-        output_lines.append(''.join(memory["symbols_by_level"][level]))
 
-    draw_dot_bridge_across_verb_group(parsed)
+# ◎ ctx.symbols_by_level 내용을 출력하기 위해 만든 함수
+def symbols_to_diagram(sentence: str, ctx: AnalysisContext):
+    line_length = ctx.sentence_length
+    tav_line = finish_diagram(sentence, ctx)
 
-    return '\n'.join(output_lines)
+    # 시제 줄 + level 줄들을 1번에 문자열로 바꾸고, 둘째 줄에 문장 텍스트를 끼움
+    lines = ctx.symbols_by_level.render(tav_line)
+    output = lines[:line_length] + "\n" + sentence + lines[line_length:]
 
+    draw_dot_bridge_across_verb_group(ctx.parsed, ctx)
 
-def guess_combine_second(parsed):
-    for token in parsed:
-        combine = guess_combine(token, parsed)
-        if combine:
-            token["combine"] = combine
-    return parsed
+    return output
+
+
+# ◎ 도식 중간 표현 (span 목록) : 글자 도식 대신 줄마다 같은 심볼이 이어진 구간만 남긴다.
+#    /v2 응답은 이걸 그대로 주고, 예전 글자 도식은 필요할 때만 render_diagram()으로 만든다 (결과 캐시도 이 형태로 저장).
+#    {"width": 문장 글자 수, "levels": [줄 level 오름차순 (빈 줄 포함)],
+#     "tense": [[start, end, 심볼], ...], "spans": [[level, start, end, 심볼], ...]}   (end 미포함)
+def symbols_to_spans(sentence: str, ctx: AnalysisContext) -> dict:
+    tav_line = finish_diagram(sentence, ctx)
+    grid = ctx.symbols_by_level
+    diagram = {
+        "width": ctx.sentence_length,
+        "levels": sorted(grid.rows),
+        "tense": [list(run) for run in line_runs(tav_line)],
+        "spans": grid.spans(),
+    }
+
+    draw_dot_bridge_across_verb_group(ctx.parsed, ctx)  # symbols_to_diagram과 같은 순서 유지
+
+    return diagram
+
+
+# span 목록 → 예전 글자 도식 (symbols_to_diagram 출력과 같음)
+def render_diagram(sentence: str, diagram: dict) -> str:
+    width = diagram["width"]
+    grid = DiagramGrid(width)
+    for level in diagram["levels"]:
+        grid.ensure(level)
+    for level, start, end, symbol in diagram["spans"]:
+        grid.cells[grid.rows[level], start:end] = symbol
+    tav_line = np.full(width, " ", dtype="<U1")
+    for start, end, symbol in diagram["tense"]:
+        tav_line[start:end] = symbol
+
+    lines = grid.render(tav_line)
+    return lines[:width] + "\n" + sentence + lines[width:]
+
+
+# 분석 결과(span 형태) → 글자 도식을 붙인 새 dict (캐시에 든 결과는 건드리지 않음)
+def with_diagramming(result: dict) -> dict:
+    return dict(result, diagramming=render_diagram(result["sentence"], result["diagram"]))
+
+
+@rule_passes.register()  # 항상 실행
+def guess_combine_second(parsed, index: TokenIndex = None):
+    return assign_combines(parsed, index)
 
 
 def t(sentence: str):
     print(f"\n📘 Sentence: {sentence}")
 
     # ✅ 메모리 먼저 초기화 (문장 길이 기반 설정 포함)
-    init_memorys(sentence)
+    ctx = init_memorys(sentence)
 
     # ✅ spaCy 파싱 + 역할 분석
-    parsed = spacy_parsing_backgpt(sentence)
-    memory["parsed"] = parsed
+    parsed = spacy_parsing_backgpt(sentence, ctx)
+    ctx.parsed = parsed
 
-#    if memory.get("used_gpt"):
+#    if ctx.used_gpt:
 #        print("⚠️ GPT가 파싱에 개입했음 (속도 느릴 수 있음)")
 #    else:
 #        print("✅ spaCy 규칙 기반으로 파싱 완료")
 
    # NounChunk_combine_apply_to_upverb(parsed)
-    apply_symbols(parsed)
-    apply_subject_adverb_chunk_range_symbol(parsed)
-    draw_dot_bridge_across_verb_group(parsed)
+    apply_symbols(parsed, ctx)
+    apply_subject_adverb_chunk_range_symbol(parsed, ctx)
+    draw_dot_bridge_across_verb_group(parsed, ctx)
 
     # ✅ morph 상세 출력
     print("\n📊 Full Token Info with Annotations:")
@@ -1779,12 +3007,13 @@ def t(sentence: str):
         morph = token.morph.to_dict()
         idx = token.idx
         text = token.text
-        role1 = next((t.get("role1") for t in parsed if t["idx"] == idx), None)
-        role2 = next((t.get("role2") for t in parsed if t["idx"] == idx), None)
-        role3 = next((t.get("role3") for t in parsed if t["idx"] == idx), None)
+        info = ctx.index.get(idx) or {}
+        role1 = info.get("role1")
+        role2 = info.get("role2")
+        role3 = info.get("role3")
 
-        combine = next((t.get("combine") for t in parsed if t["idx"] == idx), None)
-        level = next((t.get("level") for t in parsed if t["idx"] == idx), None)
+        combine = info.get("combine")
+        level = info.get("level")
 
         combine_str = (
             "[" + ", ".join(
@@ -1809,83 +3038,1135 @@ def t(sentence: str):
         
     # ✅ 도식 출력
     print("🛠 Diagram:")
-    print(symbols_to_diagram(sentence))
+    print(symbols_to_diagram(sentence, ctx))
 
 
 # 묶음 테스트 함수
 def t1(sentence: str):
     # ✅ 메모리 먼저 초기화 (문장 길이 기반 설정 포함)
-    init_memorys(sentence)
+    ctx = init_memorys(sentence)
 
     # ✅ spaCy 파싱 + 역할 분석
-    parsed = spacy_parsing_backgpt(sentence)
-    memory["parsed"] = parsed
+    parsed = spacy_parsing_backgpt(sentence, ctx)
+    ctx.parsed = parsed
     # ✅ 도식화 및 출력
     chunk_info_list = assign_chunk_role(parsed)
     NounChunk_combine_apply_to_upverb(parsed)
-    apply_subject_adverb_chunk_range_symbol(parsed)
-    apply_symbols(parsed)
+    apply_subject_adverb_chunk_range_symbol(parsed, ctx)
+    apply_symbols(parsed, ctx)
     apply_chunk_symbols_overwrite(chunk_info_list)
-    draw_dot_bridge_across_verb_group(parsed)
+    draw_dot_bridge_across_verb_group(parsed, ctx)
     print("🛠 Diagram:")
-    print(symbols_to_diagram(sentence))
+    print(symbols_to_diagram(sentence, ctx))
+
+
+# ◎ spaCy 파싱 결과(Doc) 디스크 캐시
+# Cloud Run은 0대까지 줄었다가 새 인스턴스로 뜨므로, 한번 본 문장의 Doc을 파일에 남겨두면
+# 재시작 후에도 transformer를 건너뛰고 규칙 단계(rule_based_parse 이후)만 다시 돌릴 수 있다.
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "")                                       # 비어있으면 끔
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "100000"))
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class DocBinStore:
+    """
+    문장 해시 → spaCy DocBin 바이트를 저장하는 SQLite 파일 캐시.
+    - 스레드마다 커넥션을 따로 쓰고 WAL 모드 + busy timeout을 걸어서 여러 스레드/uvicorn 워커가 같은 파일을 함께 써도 안전
+    - max_entries / max_bytes를 넘으면 가장 오래 안 쓰인(last_used) 항목부터 지운다 (LRU)
+    - 키에 모델 이름/버전이 들어가므로 모델을 바꾸면 예전 Doc은 자동으로 안 맞게 된다
+    """
+    def __init__(self, path: str, max_entries: int, max_bytes: int, name: str = None, pipeline=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        pipeline = pipeline or nlp
+        self.nlp = pipeline
+        self.model_key = f"{name or model_name}@{pipeline.meta.get('version', '')}"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS docs_last_used ON docs(last_used)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, sentence: str) -> str:
+        return hashlib.sha256(f"{self.model_key}\x00{sentence}".encode("utf-8")).hexdigest()
+
+    def get_many(self, sentences: list) -> dict:
+        """저장된 문장만 {sentence: Doc}로 돌려준다."""
+        keys = {self.key(s): s for s in sentences}
+        conn = self._conn()
+        found = {}
+        placeholders = ",".join("?" * len(keys))
+        rows = conn.execute(f"SELECT key, data FROM docs WHERE key IN ({placeholders})", list(keys)).fetchall()
+        for key, data in rows:
+            doc_bin = DocBin().from_bytes(data)
+            found[keys[key]] = next(iter(doc_bin.get_docs(self.nlp.vocab)))
+
+        if rows:
+            conn.executemany(
+                "UPDATE docs SET last_used = ? WHERE key = ?",
+                [(time.time(), key) for key, _ in rows]
+            )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, docs: list):
+        rows = []
+        for doc in docs:
+            doc_bin = DocBin(store_user_data=False)
+            doc_bin.add(doc)
+            data = doc_bin.to_bytes()
+            rows.append((self.key(doc.text), data, len(data), time.time()))
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO docs(key, data, size, last_used) VALUES (?, ?, ?, ?)", rows)
+            evicted = self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.writes += len(rows)
+            self.evictions += evicted
+
+    def _evict(self, conn) -> int:
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM docs").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM docs ORDER BY last_used"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM docs WHERE key = ?", victims)
+        return len(victims)
+
+    def stats(self) -> dict:
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM docs").fetchone()
+        with self._lock:
+            return {
+                "path": self.path,
+                "entries": count,
+                "bytes": total,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+doc_store = DocBinStore(PARSE_CACHE_PATH, PARSE_CACHE_MAX_ENTRIES, PARSE_CACHE_MAX_BYTES) if PARSE_CACHE_PATH else None
+
+
+class SpacyPipeline:
+    """
+    spaCy 모델 1개 + 그 모델 전용 디스크 Doc 캐시.
+    name은 token_table_cache 키에도 들어가서, 같은 문장이라도 sm/trf 파싱 결과가 섞이지 않는다.
+    """
+    def __init__(self, name: str, nlp, store: DocBinStore = None):
+        self.name = name
+        self.nlp = nlp
+        self.store = store
+
+
+accurate_pipeline = SpacyPipeline(model_name, nlp, doc_store)
+fast_pipeline = SpacyPipeline(
+    SPACY_FAST_MODEL, nlp_fast,
+    # 같은 SQLite 파일을 쓰지만 키에 모델 이름/버전이 들어가므로 항목은 따로 관리됨
+    DocBinStore(PARSE_CACHE_PATH, PARSE_CACHE_MAX_ENTRIES, PARSE_CACHE_MAX_BYTES, SPACY_FAST_MODEL, nlp_fast)
+    if PARSE_CACHE_PATH else None,
+) if nlp_fast is not None else None
+
+
+# 길이가 제각각인 문장을 한 배치에 넣으면 transformer가 가장 긴 문장 길이로 패딩하므로,
+# 토큰 수로 정렬해서 비슷한 길이끼리 배치를 만든 뒤 원래 순서로 돌려놓는다 (0이면 입력 순서 그대로)
+PARSE_SORT_BY_LENGTH = os.getenv("PARSE_SORT_BY_LENGTH", "1") == "1"
+
+
+def pipe_by_length(pipeline, texts: list, batch_size: int = None, sort: bool = None) -> list:
+    """
+    texts → Doc 목록 (입력 순서). 토크나이저만 먼저 돌려서 토큰 수를 재고, 짧은 문장부터 nlp.pipe에 넣는다.
+    (nlp.pipe는 Doc도 받으므로 토큰화는 1번만 함)
+    """
+    batch_size = batch_size or ANALYZE_BATCH_SIZE
+    if not (PARSE_SORT_BY_LENGTH if sort is None else sort):
+        return list(pipeline.pipe(texts, batch_size=batch_size))
+
+    docs = [pipeline.make_doc(text) for text in texts]
+    order = sorted(range(len(docs)), key=lambda i: len(docs[i]))
+    out = [None] * len(docs)
+    for i, doc in zip(order, pipeline.pipe([docs[i] for i in order], batch_size=batch_size)):
+        out[i] = doc
+    return out
+
+
+def parse_docs(sentences: list, batch_size: int = None, pipeline: SpacyPipeline = None) -> list:
+    """
+    문장 목록 → spaCy Doc 목록 (입력 순서 유지).
+    디스크 캐시에 있는 문장은 저장된 Doc을 쓰고, 나머지만 nlp.pipe로 (길이순 배치로) 파싱한 뒤 캐시에 저장한다.
+    pipeline : 파싱할 모델 (기본: SPACY_MODEL)
+    """
+    pipeline = pipeline or accurate_pipeline
+    doc_store = pipeline.store
+    cached = {}
+    if doc_store is not None:
+        try:
+            cached = doc_store.get_many(sentences)
+        except sqlite3.Error as e:
+            print("[ERROR] parse cache read failed:", e)
+
+    missing = [s for s in dict.fromkeys(sentences) if s not in cached]
+    if missing:
+        parsed_docs = pipe_by_length(pipeline.nlp, missing, batch_size)
+        cached.update(zip(missing, parsed_docs))
+        if doc_store is not None:
+            try:
+                doc_store.put_many(parsed_docs)
+            except sqlite3.Error as e:
+                print("[ERROR] parse cache write failed:", e)
+
+    return [cached[s] for s in sentences]
+
+
+# doc 모드는 규칙 결과를 Doc에 직접 쓰므로, 같은 문장이 여러 번 들어와 같은 Doc 객체를 받은 자리는 복사본으로 바꿔준다.
+def fresh_docs(docs: list) -> list:
+    seen = set()
+    out = []
+    for doc in docs:
+        out.append(doc.copy() if id(doc) in seen else doc)
+        seen.add(id(doc))
+    return out
+
+
+# 분석 결과를 Token._ 에 채운 Doc을 돌려준다 (Doc을 직접 쓰는 후속 처리용). 결과 dict도 같이 반환.
+#   doc, result = annotate_doc(nlp("She painted the wall green."))
+#   [(t.text, t._.role1, t._.level) for t in doc]
+def annotate_doc(doc) -> tuple:
+    result = analyze_sentence(doc.text, doc=doc, use_doc_view=True)
+    return doc, result
+
+
+def load_token_tables(sentences: list, batch_size: int = None, pipeline: SpacyPipeline = None) -> list:
+    """
+    문장 목록 → 토큰 테이블 목록 (입력 순서 유지, 규칙 단계가 고쳐도 되는 복사본).
+    1단 캐시(token_table_cache, 모델+문장 키)에 있으면 바로 쓰고, 없으면
+    parse_docs(디스크 Doc 캐시 → nlp.pipe)로 파싱해서 1단 캐시에 채운다.
+    규칙만 바뀐 배포에서는 이 테이블/디스크 Doc으로 도식만 다시 계산하므로 transformer를 타지 않는다.
+    """
+    pipeline = pipeline or accurate_pipeline
+    tables = {}
+    for s in dict.fromkeys(sentences):
+        table = token_table_cache.get((pipeline.name, s))
+        if table is not None:
+            tables[s] = table
+
+    missing = [s for s in dict.fromkeys(sentences) if s not in tables]
+    if missing:
+        for s, doc in zip(missing, parse_docs(missing, batch_size, pipeline)):
+            table = doc_to_tokens(doc)
+            if token_table_cache.enabled:
+                cached = copy_token_table(table, detach=True)  # 캐시에는 Doc 참조 없는 복사본만
+                token_table_cache.put((pipeline.name, s), cached, size=token_table_size(cached))
+            tables[s] = table
+
+    return [copy_token_table(tables[s]) for s in sentences]
+
+
+# ◎ 모델 라우팅 (SPACY_FAST_MODEL 지정시) : 빠른 모델 + 규칙 엔진 결과에서 싼 위험 신호만 보고 정확한 모델로 올릴지 결정
+ROUTE_MAX_FAST_TOKENS = int(os.getenv("ROUTE_MAX_FAST_TOKENS", "25"))   # 이보다 긴 문장은 정확한 모델로
+# 켤 위험 신호 목록 (쉼표 구분). 빼면 그만큼 더 많은 문장이 빠른 모델 결과로 끝남 (속도 ↔ 정확도 조절용)
+ROUTE_SIGNALS = frozenset(
+    name.strip() for name in os.getenv(
+        "ROUTE_SIGNALS", "length,level_trigger,chunk_not_decide,unresolved_combine,blacklist_preposition"
+    ).split(",") if name.strip()
+)
+
+# 동사/전치사의 combine으로 연결돼야 하는 역할 (연결이 하나도 없으면 파싱이 어긋났을 가능성이 큼)
+COMBINE_TARGET_ROLES = frozenset({
+    "object", "direct object", "indirect object", "prepositional object",
+    "noun subject complement", "adjective subject complement",
+    "noun object complement", "adjective object complement",
+})
+
+
+def routing_risks(ctx: AnalysisContext) -> list:
+    """빠른 모델로 분석한 ctx에서 정확한 모델로 다시 분석해야 할 이유 목록 (없으면 빈 list)"""
+    index = ctx.index
+    tokens = index.tokens
+    reasons = []
+    if "length" in ROUTE_SIGNALS and len(tokens) > ROUTE_MAX_FAST_TOKENS:
+        reasons.append("length")
+    if "level_trigger" in ROUTE_SIGNALS and any(t.get("dep") in level_trigger_deps for t in tokens):
+        reasons.append("level_trigger")
+    if "chunk_not_decide" in ROUTE_SIGNALS and any(t.get("role3") == "chunk_not_decide" for t in tokens):
+        reasons.append("chunk_not_decide")
+    if "unresolved_combine" in ROUTE_SIGNALS:
+        linked = {c.get("idx") for t in tokens for c in (t.get("combine") or [])}
+        if any(t.get("role1") in COMBINE_TARGET_ROLES and t["idx"] not in linked for t in tokens):
+            reasons.append("unresolved_combine")
+    if "blacklist_preposition" in ROUTE_SIGNALS and any(
+        index.lex_of(t) & LEX["blacklist_preposition_words"] for t in tokens
+    ):
+        reasons.append("blacklist_preposition")
+    return reasons
+
+
+class ModelRouter:
+    """라우팅 통계 (빠른 모델로 끝난 문장 / 정확한 모델로 올린 문장 수, 이유별 횟수)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sentences = 0
+        self.escalated = 0
+        self.reasons = {}
+        # 라우팅 설정이 바뀌면 결과도 달라지므로 result_cache 키에 넣는다
+        self.key = (
+            f"{SPACY_FAST_MODEL}>{model_name}:{ROUTE_MAX_FAST_TOKENS}:{','.join(sorted(ROUTE_SIGNALS))}"
+            if fast_pipeline is not None else model_name
+        )
+
+    def record(self, reasons: list):
+        with self._lock:
+            self.sentences += 1
+            if reasons:
+                self.escalated += 1
+            for reason in reasons:
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": fast_pipeline is not None,
+                "fast_model": fast_pipeline.name if fast_pipeline is not None else None,
+                "accurate_model": accurate_pipeline.name,
+                "max_fast_tokens": ROUTE_MAX_FAST_TOKENS,
+                "signals": sorted(ROUTE_SIGNALS),
+                "sentences": self.sentences,
+                "escalated": self.escalated,
+                "escalation_share": round(self.escalated / self.sentences, 4) if self.sentences else 0.0,
+                "reasons": dict(self.reasons),
+            }
+
+
+model_router = ModelRouter()
+
+
+# ◎ 문장 1개 분석 파이프라인 (API/배치/테스트 공용)
+def analyze_sentence(sentence: str, doc=None, tokens=None, use_doc_view: bool = None,
+                     symbols: SymbolTable = None, render_text: bool = True,
+                     pipeline: SpacyPipeline = None) -> dict:
+    """
+    문장 1개를 분석해서 /analyze 응답 dict를 돌려준다.
+    상태는 전부 이 호출에서 만든 AnalysisContext에만 저장되므로 동시에 여러 개 호출해도 된다.
+    doc(파싱된 Doc)이나 tokens(토큰 테이블)를 넘기면 spaCy 파싱을 건너뛰고 규칙/도식 단계만 실행한다.
+    use_doc_view(기본: TOKEN_TABLE_ENGINE=doc)면 토큰 테이블 없이 Doc 위에서 분석하고 결과를 Token._ 에 남긴다.
+    symbols : 도식에 쓸 심볼 세트 (없으면 default)
+    도식은 diagram(span 목록)으로 주고, render_text면 글자 도식(diagramming)도 같이 넣는다 (API는 False, 필요할 때 with_diagramming).
+    pipeline : doc/tokens를 파싱한 모델. 안 주고 파싱도 안 돼 있으면 라우팅(빠른 모델 → 필요시 정확한 모델)을 탄다.
+    """
+    if doc is None and tokens is None and pipeline is None and fast_pipeline is not None:
+        result = analyze_many([sentence], symbols=symbols, render_text=render_text, use_doc_view=use_doc_view)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    pipeline = pipeline or accurate_pipeline
+    if use_doc_view is None:
+        use_doc_view = TOKEN_TABLE_ENGINE == "doc"
+    ctx = init_memorys(sentence, symbols)            # 요청 전용 저장공간 생성
+    if doc is None and tokens is None:
+        if use_doc_view:
+            doc = parse_docs([sentence], pipeline=pipeline)[0]          # 디스크 Doc 캐시 → 없으면 파싱 (매번 새 Doc)
+        else:
+            tokens = load_token_tables([sentence], pipeline=pipeline)[0]    # 캐시에 있으면 transformer 건너뜀
+    parsed = spacy_parsing_backgpt(sentence, ctx, doc=doc, tokens=tokens, use_doc_view=use_doc_view)  # spaCy 파싱 + 규칙 기반 역할 분석
+    ctx.parsed = parsed
+    apply_symbols(parsed, ctx)
+    apply_subject_adverb_chunk_range_symbol(parsed, ctx)
+    draw_dot_bridge_across_verb_group(parsed, ctx)
+    result = {"sentence": sentence,
+            "diagram": symbols_to_spans(sentence, ctx),
+            "verb_attribute": ctx.verb_attribute,
+            "used_gpt": ctx.used_gpt,  # ✅ 결과 포함
+            # 사전 교체시 이 결과를 캐시에서 지워야 하는지 판단용 (API 응답에는 안 나감, 캐시 저장 전에 뺌)
+            "lexicon_keys": frozenset(k for t in ctx.index.tokens for k in Lexicon.lookup_keys(t)),
+            "model": pipeline.name,
+    }
+    if pipeline is fast_pipeline:
+        result["escalate"] = routing_risks(ctx)  # analyze_many가 보고 빼냄 (API 응답에는 안 나감)
+    if render_text:
+        result = with_diagramming(result)
+    return result
+
+
+# ◎ 여러 문장 배치 분석 (nlp.pipe로 한번에 파싱 → Doc마다 규칙/도식 파이프라인)
+ANALYZE_BATCH_SIZE = int(os.getenv("ANALYZE_BATCH_SIZE", "32"))                    # nlp.pipe batch_size 기본값
+ANALYZE_BATCH_MAX_SENTENCES = int(os.getenv("ANALYZE_BATCH_MAX_SENTENCES", "256"))  # 요청 1건당 최대 문장 수
+
+def analyze_many(sentences: list, batch_size: int = None, symbols=None, render_text: bool = True,
+                 use_doc_view: bool = None, escalate: bool = True) -> list:
+    """
+    문장 목록을 nlp.pipe로 묶어서 파싱(transformer 배치 추론)한 뒤 문장마다 analyze_sentence를 돌린다.
+    결과는 입력 순서 그대로이고, 실패한 문장 자리에는 발생한 Exception 객체가 들어간다.
+    symbols : 전체에 쓸 SymbolTable 1개 또는 문장별 목록 (마이크로배치는 요청마다 다를 수 있음)
+    SPACY_FAST_MODEL이 있으면 전부 빠른 모델로 먼저 분석하고, routing_risks에 걸린 문장(빠른 모델에서 실패한 문장 포함)만
+    모아서 정확한 모델로 한번 더 배치 분석한다. escalate=False면 빠른 모델 결과 그대로 (과부하시 light 단계).
+    """
+    batch_size = batch_size or ANALYZE_BATCH_SIZE
+    if not isinstance(symbols, list):
+        symbols = [symbols] * len(sentences)
+    if use_doc_view is None:
+        use_doc_view = TOKEN_TABLE_ENGINE == "doc"
+    if fast_pipeline is None:
+        return analyze_with(accurate_pipeline, sentences, batch_size, symbols, render_text, use_doc_view)
+
+    results = analyze_with(fast_pipeline, sentences, batch_size, symbols, render_text, use_doc_view)
+    retry = []
+    for i, result in enumerate(results):
+        reasons = result.pop("escalate") if isinstance(result, dict) else ["error"]
+        if not escalate:
+            continue
+        model_router.record(reasons)
+        if reasons:
+            retry.append(i)
+    if retry:
+        retried = analyze_with(accurate_pipeline, [sentences[i] for i in retry], batch_size,
+                               [symbols[i] for i in retry], render_text, use_doc_view)
+        for i, result in zip(retry, retried):
+            results[i] = result
+    return results
+
+
+def analyze_with(pipeline: SpacyPipeline, sentences: list, batch_size: int, symbols: list,
+                 render_text: bool, use_doc_view: bool) -> list:
+    """analyze_many 본체 : 정해진 모델 1개로 배치 파싱 → 문장별 분석"""
+    tables = docs = [None] * len(sentences)
+
+    try:
+        if use_doc_view:
+            docs = fresh_docs(parse_docs(sentences, batch_size, pipeline))
+        else:
+            tables = load_token_tables(sentences, batch_size, pipeline)
+    except Exception as e:
+        # 배치 파싱 자체가 실패하면 문장별 파싱으로 물러나서 어느 문장이 문제인지 항목별로 알려줌
+        print("[ERROR] nlp.pipe batch failed, fallback to per-sentence parsing:", e)
+
+    results = []
+    for sentence, tokens, doc, sentence_symbols in zip(sentences, tables, docs, symbols):
+        try:
+            results.append(analyze_sentence(sentence, doc=doc, tokens=tokens, use_doc_view=use_doc_view,
+                                            symbols=sentence_symbols, render_text=render_text, pipeline=pipeline))
+        except Exception as e:
+            print(f"[ERROR] batch item failed: {sentence!r}:", e)
+            results.append(e)
+    return results
+
+
+def analyze_batch(sentences: list, batch_size: int = None, symbols: SymbolTable = None,
+                  render_text: bool = True, escalate: bool = True) -> list:
+    """
+    /analyze/batch 응답용 : analyze_many 결과에서 실패한 문장은 {"sentence", "error"}로 바꿔서 돌려준다.
+    """
+    return [
+        {"sentence": sentence, "error": f"{type(result).__name__}: {result}"}
+        if isinstance(result, Exception) else result
+        for sentence, result in zip(sentences, analyze_many(sentences, batch_size, symbols, render_text,
+                                                            escalate=escalate))
+    ]
 
 
 
 # ◎ 모듈 외부 사용을 위한 export
 __all__ = [
+    "TokenIndex",
+    "TokenColumns",
+    "guess_roles_columnar",
     "rule_based_parse",
     "guess_role",
     "assign_noun_complement_for_SVOC_noun_only",
     "repair_object_from_complement",
     "guess_combine",
+    "assign_combines",
     "assign_level_trigger_ranges",
+    "doc_to_tokens",
+    "TokenRecord",
+    "DocToken",
+    "doc_view",
+    "annotate_doc",
     "spacy_parsing_backgpt",
     "gpt_parsing_withprompt",
+    "AnalysisContext",
     "init_memorys",
+    "analyze_sentence",
+    "analyze_many",
+    "analyze_batch",
     "apply_symbols",
     "symbols_to_diagram",
-    "t", "t1"
+    "symbols_to_spans",
+    "render_diagram",
+    "t", "t1",
 ]
 
 # 테스트 문장 자동 실행
 
 
+# ◎ 분석 결과 캐시 (2단 구성)
+# - 1단 token_table_cache : spaCy 토큰 테이블 (모델+문장 키) → 규칙이 바뀌어도 그대로 유효
+# - 2단 result_cache      : 완성된 AnalyzeResponse (모델+문장+규칙 fingerprint 키)
+# 규칙만 바뀐 경우 2단만 빗나가고, 1단(또는 디스크 Doc 캐시)의 파싱 결과로 도식만 다시 계산한다.
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "4096"))              # 0이면 캐시 끔
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 저장 결과 총 크기 제한
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096"))                # 0이면 1단 캐시 끔
+TOKEN_CACHE_MAX_BYTES = int(os.getenv("TOKEN_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+
+def compute_engine_fingerprint() -> str:
+    """
+    규칙 엔진(이 파일 소스)으로 만든 해시. 규칙이 바뀐 배포에서는 값이 달라져서 예전 캐시 항목은 자동으로 안 맞게 된다.
+    어휘 사전은 실행 중에 바뀔 수 있으므로 여기 넣지 않고, 바뀔 때 관련 결과만 지운다 (swap_lexicon).
+    """
+    h = hashlib.sha256()
+    with open(__file__, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+ENGINE_FINGERPRINT = compute_engine_fingerprint()
+
+
+class LRUCache:
+    """
+    엔트리 수와 바이트 수 두 가지로 크기가 제한되는 LRU 캐시 (스레드 안전).
+    값의 크기는 JSON 직렬화 길이로 추정하고, hit/miss/eviction 횟수를 기록한다.
+    항목에 tag(집합)를 붙여두면 invalidate_tagged()로 tag가 겹치는 항목만 지울 수 있다.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key → (value, size, tags)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0  # invalidate_tagged() 할 때마다 +1
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size: int = None, tags: frozenset = None, generation: int = None):
+        """generation : 값 계산을 시작할 때 읽어둔 self.generation. 그 사이 무효화가 있었으면 저장하지 않는다."""
+        if not self.enabled:
+            return
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return  # 하나만으로 한도를 넘는 값은 저장 안 함
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size, tags)
+            self._bytes += size
+
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate_tagged(self, tags: set) -> int:
+        """tag가 하나라도 겹치는 항목을 지우고 지운 개수를 돌려준다."""
+        with self._lock:
+            self.generation += 1
+            stale = [key for key, (_, _, item_tags) in self._data.items()
+                     if item_tags is not None and not tags.isdisjoint(item_tags)]
+            for key in stale:
+                _, size, _ = self._data.pop(key)
+                self._bytes -= size
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_table_cache = LRUCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_MAX_BYTES)
+result_cache = LRUCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES)
+
+
+def result_cache_key(sentence: str, symbol_set: str = "default", tier: str = "full") -> tuple:
+    # sentence는 클라이언트가 보낸 그대로 (공백이 다르면 도식 칸 위치도 다르므로 다른 키)
+    # 사전은 key에 없음 → swap_lexicon이 관련 항목만 지움
+    # light 결과는 따로 저장해서, 과부하가 끝난 뒤 full 요청이 품질 낮은 결과를 받지 않게 함
+    return (sentence, model_router.key, ENGINE_FINGERPRINT, symbol_set, tier)
+
+
+def resolve_symbol_set(name: Optional[str]) -> SymbolTable:
+    table = symbol_tables.get(name or "default")
+    if table is None:
+        raise HTTPException(status_code=400, detail=f"unknown symbol_set: {name!r}")
+    return table
+
+
+# ◎ 어휘 사전 실행 중 교체 : 모델을 다시 읽지 않고 사전만 바꾼다.
+#    새 TokenIndex부터 새 사전을 쓰고(분석 중인 문장은 시작할 때 사전 그대로), 결과 캐시는 바뀐 단어가 들어간 문장만 지운다.
+LEXICON_WATCH_INTERVAL = float(os.getenv("LEXICON_WATCH_INTERVAL", "5"))  # 사전 파일 감시 주기(초), 0이면 감시 안 함
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # POST /admin/lexicon 용 (비어 있으면 endpoint 사용 불가)
+lexicon_swap_lock = threading.Lock()
+lexicon_swaps = {"count": 0, "last": None}
+
+
+def swap_lexicon(new_lexicon: Lexicon) -> dict:
+    global lexicon, LEXICONS
+    global SVOC_noun_only, SVOC_adj_only, SVOC_both, noSubjectComplementVerbs, noObjectVerbs
+    global modalVerbs_present, modalVerbs_past, modalVerbs_all, beVerbs
+    global notbeLinkingVerbs_onlySVC, notbeLinkingVerbs_SVCSVO, netbeLinkingVerbs_all
+    global dativeVerbs, blacklist_preposition_words, rule_matchers
+
+    with lexicon_swap_lock:
+        # matcher는 교체 전에 컴파일해두고 사전과 같이 바꾼다 (새 사전 첫 문장부터 바로 사용)
+        matchers = RuleMatchers(nlp.vocab, new_lexicon) if RULE_MATCHER_ENGINE else None
+        changed = lexicon.changed_keys(new_lexicon)
+        lexicon = new_lexicon
+        rule_matchers = matchers
+        LEXICONS = new_lexicon.sets
+        SVOC_noun_only = new_lexicon.words("SVOC_noun_only")
+        SVOC_adj_only = new_lexicon.words("SVOC_adj_only")
+        SVOC_both = new_lexicon.words("SVOC_both")
+        noSubjectComplementVerbs = new_lexicon.words("noSubjectComplementVerbs")
+        noObjectVerbs = new_lexicon.words("noObjectVerbs")
+        modalVerbs_present = new_lexicon.words("modalVerbs_present")
+        modalVerbs_past = new_lexicon.words("modalVerbs_past")
+        modalVerbs_all = modalVerbs_present | modalVerbs_past
+        beVerbs = new_lexicon.words("beVerbs")
+        notbeLinkingVerbs_onlySVC = new_lexicon.words("notbeLinkingVerbs_onlySVC")
+        notbeLinkingVerbs_SVCSVO = new_lexicon.words("notbeLinkingVerbs_SVCSVO")
+        netbeLinkingVerbs_all = notbeLinkingVerbs_SVCSVO | notbeLinkingVerbs_onlySVC
+        dativeVerbs = new_lexicon.words("dativeVerbs")
+        blacklist_preposition_words = new_lexicon.words("blacklist_preposition_words")
+
+        # 교체 후에 지워야, 지우는 동안 끝난 예전 사전 결과가 다시 들어오지 않는다 (generation 확인)
+        invalidated = result_cache.invalidate_tagged(changed) if changed else 0
+
+        summary = {
+            "version": new_lexicon.version,
+            "source": new_lexicon.source,
+            "changed_words": len(changed),
+            "invalidated": invalidated,
+            "at": time.time(),
+        }
+        lexicon_swaps["count"] += 1
+        lexicon_swaps["last"] = summary
+    print(f"[LEXICON] swapped to version {new_lexicon.version} ({len(changed)} words changed, {invalidated} cached results dropped)")
+    return summary
+
+
+class LexiconWatcher:
+    """사전 파일의 수정 시각/크기를 주기적으로 확인해서 바뀌면 다시 읽어 교체 (읽기 실패시 기존 사전 유지)"""
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self._signature = self._stat()
+        self._thread = None
+        self.errors = 0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def check(self) -> Optional[dict]:
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        try:
+            return swap_lexicon(Lexicon.load(self.path))
+        except (OSError, ValueError, AttributeError, TypeError) as e:  # json.JSONDecodeError 포함 (/admin/lexicon과 같음)
+            self.errors += 1
+            print(f"[ERROR] lexicon reload failed ({self.path}):", e)
+            return None
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:  # 예상 못한 오류로 감시 스레드가 죽으면 프로세스가 끝날 때까지 다시 안 읽으므로
+                self.errors += 1
+                print(f"[ERROR] lexicon watcher ({self.path}):", e)
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="lexicon-watcher", daemon=True)
+            self._thread.start()
+
+
+lexicon_watcher = LexiconWatcher(LEXICON_PATH, LEXICON_WATCH_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_lexicon_watcher():
+    lexicon_watcher.start()
+
+
+# ◎ 분석 작업 전용 실행기 : spaCy 추론(trf 수백 ms)이 이벤트 루프를 막지 않도록 스레드 풀에서 실행
+ANALYZE_WORKERS = int(os.getenv("ANALYZE_WORKERS", "2"))      # 동시에 분석하는 스레드 수
+ANALYZE_MAX_QUEUE = int(os.getenv("ANALYZE_MAX_QUEUE", "64"))  # 스레드 풀에 넣어둘 수 있는 대기 작업 수
+
+
+class AnalyzeExecutor:
+    """
+    분석 작업을 크기가 정해진 스레드 풀에서 돌리고, 대기열 길이와 대기 시간을 기록한다.
+    - 풀에 들어간 작업은 max_workers + max_queue 개로 제한되고, 나머지는 이벤트 루프에서 (블로킹 없이) 기다린다.
+    - queued: 제출됐지만 아직 스레드를 못 잡은 작업 수, running: 실행 중인 작업 수
+    - wait: 제출 ~ 실제 실행 시작까지 걸린 시간(초)
+    """
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyze")
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+
+        with self._lock:
+            self.queued += 1
+
+        def job():
+            wait = time.perf_counter() - submitted
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                self.wait_last = wait
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        async with self._slots:
+            return await loop.run_in_executor(self._pool, job)
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "wait_avg_ms": round(self.wait_total / started * 1000, 3) if started else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_last_ms": round(self.wait_last * 1000, 3),
+            }
+
+
+analyze_executor = AnalyzeExecutor(ANALYZE_WORKERS, ANALYZE_MAX_QUEUE)
+
+
+# ◎ 마이크로배치 스케줄러 : 몇 ms 안에 동시에 들어온 단일 문장 /analyze 요청을 nlp.pipe 1번으로 묶음
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "8"))             # 1 이하면 마이크로배치 끔
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))     # 첫 요청 이후 최대 대기 시간
+
+
+class MicroBatcher:
+    """
+    단일 문장 요청을 잠깐 모아두었다가 max_size 개가 차거나 max_wait_ms 가 지나면
+    analyze_many(nlp.pipe)로 한번에 분석하고, 결과를 기다리던 코루틴들에게 나눠준다.
+    상태는 이벤트 루프 스레드에서만 바뀌므로 별도 락이 필요 없다.
+    """
+    def __init__(self, max_size: int, max_wait_ms: float, executor: AnalyzeExecutor):
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self._pending = []      # (sentence, symbols, future, 대기 시작 시각)
+        self._timer = None
+        self._tasks = set()     # 실행 중인 배치 태스크 (루프는 약한 참조만 들고 있다)
+        self.batches = 0
+        self.requests = 0
+        self.batch_size_hist = {}  # 배치 크기 → 횟수
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    async def submit(self, sentence: str, symbols: SymbolTable = None) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((sentence, symbols, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        # 배치로 묶이느라 추가로 기다린 시간 기록
+        now = time.perf_counter()
+        for _, _, _, enqueued in batch:
+            wait = now - enqueued
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+        self.batches += 1
+        self.requests += len(batch)
+        self.batch_size_hist[len(batch)] = self.batch_size_hist.get(len(batch), 0) + 1
+
+        sentences = [sentence for sentence, _, _, _ in batch]
+        symbols = [symbols for _, symbols, _, _ in batch]
+        try:
+            results = await self.executor.run(analyze_many, sentences, None, symbols, False)
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, _, future, _), result in zip(batch, results):
+            if future.done():   # 클라이언트가 먼저 끊은 경우
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "batch_size_hist": {str(k): v for k, v in sorted(self.batch_size_hist.items())},
+            "queue_wait_avg_ms": round(self.queue_wait_total / self.requests * 1000, 3) if self.requests else 0.0,
+            "queue_wait_max_ms": round(self.queue_wait_max * 1000, 3),
+        }
+
+
+micro_batcher = MicroBatcher(MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS, analyze_executor)
+
+
+# ◎ 동일 요청 합치기(single-flight) : 한 반 40명이 같은 숙제 문장을 동시에 보내도 분석은 1번만
+class SingleFlight:
+    """
+    같은 키의 분석이 이미 진행 중이면 새 작업을 시작하지 않고 그 작업의 결과를 함께 기다린다.
+    작업은 별도 Task로 돌리므로 먼저 요청한 클라이언트가 끊어도 나머지 대기자는 결과를 받는다.
+    결과 캐시 사용 여부와 상관없이 동작하며, 이벤트 루프 스레드에서만 사용한다.
+    """
+    def __init__(self):
+        self._inflight = {}  # key → asyncio.Task
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, coro_factory):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(coro_factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def in_flight(self, key) -> bool:
+        return key in self._inflight
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 대기자가 모두 끊긴 경우에도 'exception was never retrieved' 경고 방지
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+single_flight = SingleFlight()
+
+
+# ◎ 과부하 제어 (수업 시간 몰림) : 대기열/최근 지연시간을 보고 품질 단계를 낮추거나 429로 돌려보냄
+ADMISSION_SOFT_QUEUE = int(os.getenv("ADMISSION_SOFT_QUEUE", "64"))             # 대기 문장이 이만큼이면 light 단계
+ADMISSION_SOFT_LATENCY_MS = float(os.getenv("ADMISSION_SOFT_LATENCY_MS", "2000"))  # 최근 응답 지연이 이 이상이면 light 단계
+ADMISSION_HARD_QUEUE = int(os.getenv("ADMISSION_HARD_QUEUE", "512"))            # 대기 문장이 이만큼이면 429 (0이면 안 막음)
+ADMISSION_LATENCY_HALF_LIFE = float(os.getenv("ADMISSION_LATENCY_HALF_LIFE", "10"))  # 최근 지연이 새 측정 없이 반으로 줄어드는 시간(초)
+
+
+class AdmissionController:
+    """
+    캐시에 없는 분석 요청을 받을지, 어느 품질 단계로 처리할지 정한다.
+    - full  : 평소 파이프라인 (SPACY_FAST_MODEL 라우팅 포함)
+    - light : 빠른 모델 결과만 씀 (정확한 모델로 안 올림). SPACY_FAST_MODEL이 없으면 이 단계는 건너뜀
+    - cache : 결과 캐시에서 바로 응답 (과부하 중에는 light로 저장된 결과도 씀)
+    대기량 = 받아들였지만 아직 응답 안 한 문장 수 (배치 요청은 분석할 문장 수만큼). 실행기 대기열이 꽉 찬 경우도 과부하로 본다.
+    지연은 분석을 기다린 시간까지 포함한 지수이동평균이고, 새 측정이 없으면 half_life마다 반으로 줄어든다.
+    hard_queue를 넘으면 HTTP 429 + Retry-After(최근 지연 기준 초)를 돌려준다.
+    """
+    def __init__(self, executor: AnalyzeExecutor, soft_queue: int, soft_latency_ms: float, hard_queue: int,
+                 half_life: float):
+        self.executor = executor
+        self.soft_queue = soft_queue
+        self.soft_latency = soft_latency_ms / 1000
+        self.hard_queue = hard_queue
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._latency = 0.0      # 마지막 측정 시점의 지연 (초, EWMA)
+        self._latency_at = 0.0   # 그 시점 (time.monotonic)
+        self.active = 0          # 분석 중인 문장 수 (이벤트 루프 스레드에서만 바뀜)
+        self.tiers = {"full": 0, "light": 0, "cache": 0}
+        self.rejected = 0
+
+    def depth(self) -> int:
+        return self.active
+
+    @contextlib.contextmanager
+    def tracking(self, count: int = 1):
+        self.active += count
+        try:
+            yield
+        finally:
+            self.active -= count
+
+    def _decayed(self, now: float) -> float:
+        if self.half_life <= 0 or not self._latency:
+            return self._latency
+        return self._latency * 0.5 ** ((now - self._latency_at) / self.half_life)
+
+    @property
+    def latency(self) -> float:
+        """최근 지연 (초). 측정이 없던 시간만큼 줄어든 값"""
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+    def under_pressure(self) -> bool:
+        return (
+            self.depth() >= self.soft_queue
+            or self.executor.queued >= self.executor.max_queue
+            or self.latency >= self.soft_latency
+        )
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.latency))
+
+    def admit(self, count: int = 1) -> str:
+        """문장 count개를 분석할 품질 단계를 돌려준다 (full / light). 한도를 넘었으면 429 HTTPException"""
+        depth = self.depth()
+        if self.hard_queue and depth and depth + count > self.hard_queue:  # 비어 있으면 큰 배치도 1번은 받는다
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(status_code=429, detail=f"server busy: {depth} sentences waiting",
+                                headers={"Retry-After": str(self.retry_after())})
+        tier = "light" if fast_pipeline is not None and self.under_pressure() else "full"
+        self.record(tier, count)
+        return tier
+
+    def record(self, tier: str, count: int = 1):
+        with self._lock:
+            self.tiers[tier] += count
+
+    def observe(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            current = self._decayed(now)
+            self._latency = seconds if not current else 0.8 * current + 0.2 * seconds
+            self._latency_at = now
+
+    def stats(self) -> dict:
+        latency = self.latency
+        with self._lock:
+            return {
+                "soft_queue": self.soft_queue,
+                "soft_latency_ms": self.soft_latency * 1000,
+                "hard_queue": self.hard_queue,
+                "latency_half_life_s": self.half_life,
+                "depth": self.depth(),
+                "executor_queued": self.executor.queued,
+                "latency_ms": round(latency * 1000, 3),
+                "light_available": fast_pipeline is not None,
+                "tiers": dict(self.tiers),
+                "rejected": self.rejected,
+            }
+
+
+admission = AdmissionController(analyze_executor, ADMISSION_SOFT_QUEUE, ADMISSION_SOFT_LATENCY_MS,
+                                ADMISSION_HARD_QUEUE, ADMISSION_LATENCY_HALF_LIFE)
+
+
+async def run_analysis(sentence: str, key: tuple, symbols: SymbolTable = None, tier: str = "full") -> dict:
+    """캐시에 없는 문장 1개를 실제로 분석하고 결과 캐시에 저장한다."""
+    # spaCy 추론 + 규칙 분석은 스레드 풀에서 실행 (그동안 /ping 등 다른 요청은 계속 처리됨)
+    # 동시에 들어온 요청은 마이크로배치로 묶어서 nlp.pipe 1번으로 처리
+    generation = result_cache.generation  # 분석 도중 사전이 바뀌면 이 결과는 캐시에 넣지 않음
+    started = time.perf_counter()
+    if tier == "light":
+        # 빠른 모델만 쓰므로 배치로 묶지 않고 바로 실행
+        result = (await analyze_executor.run(analyze_many, [sentence], None, symbols, False, None, False))[0]
+        if isinstance(result, Exception):
+            raise result
+    elif MICROBATCH_MAX_SIZE > 1:
+        result = await micro_batcher.submit(sentence, symbols)
+    else:
+        result = await analyze_executor.run(analyze_sentence, sentence, None, None, None, symbols, False)
+    admission.observe(time.perf_counter() - started)
+
+    tags = result.pop("lexicon_keys", None)
+    result_cache.put(key, result, tags=tags, generation=generation)
+    return result
+
+
 # ◎ 분석 API 엔드포인트
+# 문장 1개 분석 결과 (span 형태, 캐시 → 분석 중인 같은 문장 → 새로 분석). /analyze, /v2/analyze 공용
+async def analyze_cached(request: AnalyzeRequest) -> dict:
+    sentence = request.sentence
+    symbols = resolve_symbol_set(request.symbol_set)
+
+    # 같은 문장(+같은 모델/규칙 버전/심볼 세트)을 이미 분석했으면 캐시 결과 그대로 응답
+    key = result_cache_key(sentence, symbols.name)
+    cached = result_cache.get(key)
+    if cached is None and admission.under_pressure():
+        cached = result_cache.get(result_cache_key(sentence, symbols.name, "light"))
+    if cached is not None:
+        admission.record("cache")
+        return dict(cached, tier="cache")
+
+    # 같은 문장이 이미 분석 중이면 그 결과를 같이 기다림 (대기량/429는 작업을 시작한 요청만 센다)
+    joinable = [("full", key)]
+    if admission.under_pressure():
+        joinable.append(("light", result_cache_key(sentence, symbols.name, "light")))
+    for tier, running in joinable:
+        if single_flight.in_flight(running):
+            admission.record(tier)
+            result = await single_flight.run(running, lambda: run_analysis(sentence, running, symbols, tier))
+            return dict(result, tier=tier)
+
+    # 과부하면 light 단계로 낮추거나 429
+    tier = admission.admit()
+    if tier != "full":
+        key = result_cache_key(sentence, symbols.name, tier)
+    with admission.tracking():
+        result = await single_flight.run(key, lambda: run_analysis(sentence, key, symbols, tier))
+    return dict(result, tier=tier)
+
+
 @app.post("/analyze", response_model=AnalyzeResponse)  # sentence를 받아 "sentence"와 "diagramming" 리턴
 async def analyze(request: AnalyzeRequest):            # sentence를 받아 다음 처리로 넘김
-    init_memorys(request.sentence)                     # 이 함수로 메모리 내용 채움 또는 초기화
-    parsed = spacy_parsing_backgpt(request.sentence)               # GPT의 파싱결과를 parsed에 저장
-    memory["parsed"] = parsed
-    apply_symbols(parsed)
-    apply_subject_adverb_chunk_range_symbol(parsed)
-    draw_dot_bridge_across_verb_group(parsed)
-    return {"sentence": request.sentence,
-            "diagramming": symbols_to_diagram(request.sentence),
-            "verb_attribute": memory.get("verb_attribute", {}),
-            "used_gpt": memory.get("used_gpt", False)  # ✅ 결과 포함
-    }
+    return with_diagramming(await analyze_cached(request))
+
+
+# ◎ v2 분석 API : 글자 도식 대신 span 목록 (긴 문장/배치 응답 크기가 훨씬 작음, 클라이언트가 직접 그림)
+@app.post("/v2/analyze", response_model=AnalyzeV2Response, response_model_exclude_unset=True)
+async def analyze_v2(request: AnalyzeV2Request):
+    result = await analyze_cached(request)
+    return with_diagramming(result) if request.render else result
 
 
 # ◎ spaCy 파싱 관련
-@app.post("/parse")
-def parse_text(req: ParseRequest):
-    doc = nlp(req.text)
-    result = []
+# /parse는 ent_type까지 돌려주므로, 프로필에서 NER을 뺐으면 NER을 포함한 파이프라인을 처음 호출될 때 따로 불러온다.
+# (모델을 1벌 더 메모리에 올리므로 /parse를 자주 쓰는 배포는 SPACY_PIPELINE_PROFILE=full 권장)
+entity_pipeline = None
+entity_pipeline_lock = threading.Lock()
+
+
+def get_entity_pipeline() -> SpacyPipeline:
+    global entity_pipeline
+    if "ner" not in SPACY_EXCLUDE:
+        return accurate_pipeline  # /analyze와 같은 Doc 캐시 사용
+    with entity_pipeline_lock:
+        if entity_pipeline is None:
+            exclude = [name for name in SPACY_EXCLUDE if name != "ner"]
+            entity_pipeline = SpacyPipeline(model_name, load_spacy_model(model_name, vocab=nlp.vocab, exclude=exclude))
+        return entity_pipeline
 
-    for token in doc:
-        morph = token.morph.to_dict()
-        result.append({
-            "idx": token.idx, "text": token.text, "pos": token.pos_, "tag": token.tag_,
-            "dep": token.dep_, "head": token.head.text, "head_idx": token.head.idx,
-            "tense": morph.get("Tense"), "aspect": morph.get("Aspect"), "form": morph.get("VerbForm"),
-            "voice": morph.get("Voice"), "morph": morph, "lemma": token.lemma_,
-            "is_stop": token.is_stop, "is_punct": token.is_punct, "is_alpha": token.is_alpha,
-            "ent_type": token.ent_type_, "is_title": token.is_title,
-            "children": [child.text for child in token.children]
-        })
 
-    return {"result": result}
+@app.post("/parse")
+def parse_text(req: ParseRequest):
+    doc = parse_docs([req.text], pipeline=get_entity_pipeline())[0]
+    return {"result": [token_to_dict(token) for token in doc]}
 
 # ◎ 커스텀 OpenAPI JSON 제공 엔드포인트
 # FastAPI에서 custom-openapi.json 엔드포인트를 만들어서 GPTs에서 사용할 수 있도록 함.
@@ -1895,6 +4176,107 @@ async def serve_openapi():
     # file_path = os.path.join(os.path.dirname(__file__), "..", "openapi.json")
     return FileResponse(file_path, media_type="application/json")
 
+# ◎ 여러 문장 배치 분석 엔드포인트 (GPTs/수업 도구에서 30~200문장씩 보낼 때 사용)
+# 캐시에 없는 문장만 모아 배치 분석한 결과 목록 (span 형태). /analyze/batch, /v2/analyze/batch 공용
+async def analyze_batch_cached(request: BatchAnalyzeRequest) -> list:
+    if len(request.sentences) > ANALYZE_BATCH_MAX_SENTENCES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"too many sentences: {len(request.sentences)} > {ANALYZE_BATCH_MAX_SENTENCES}"
+        )
+    sentences = request.sentences
+    symbols = resolve_symbol_set(request.symbol_set)
+
+    # 캐시에 있는 문장은 바로 채우고, 없는 문장만 모아서 배치 분석
+    results = [result_cache.get(result_cache_key(s, symbols.name)) for s in sentences]
+    if admission.under_pressure():
+        results = [r or result_cache.get(result_cache_key(s, symbols.name, "light")) for s, r in zip(sentences, results)]
+    results = [None if r is None else dict(r, tier="cache") for r in results]
+    missing = [i for i, r in enumerate(results) if r is None]
+    admission.record("cache", len(sentences) - len(missing))
+
+    if missing:
+        tier = admission.admit(len(missing))
+        generation = result_cache.generation
+        started = time.perf_counter()
+        with admission.tracking(len(missing)):
+            fresh = await analyze_executor.run(
+                analyze_batch, [sentences[i] for i in missing], request.batch_size, symbols, False, tier == "full"
+            )
+        # 단일 문장 요청(마이크로배치 1번)과 단위를 맞추려고 nlp.pipe 배치 1개당 시간으로 환산
+        pipe_batches = math.ceil(len(missing) / (request.batch_size or ANALYZE_BATCH_SIZE))
+        admission.observe((time.perf_counter() - started) / pipe_batches)
+        for i, result in zip(missing, fresh):
+            tags = result.pop("lexicon_keys", None)
+            if "error" not in result:
+                result_cache.put(result_cache_key(sentences[i], symbols.name, tier), result, tags=tags,
+                                 generation=generation)
+                result = dict(result, tier=tier)
+            results[i] = result
+
+    return results
+
+
+@app.post("/analyze/batch", response_model=BatchAnalyzeResponse)
+async def analyze_batch_endpoint(request: BatchAnalyzeRequest):
+    results = await analyze_batch_cached(request)
+    return {"results": [r if "error" in r else with_diagramming(r) for r in results]}
+
+
+@app.post("/v2/analyze/batch", response_model=BatchAnalyzeV2Response, response_model_exclude_unset=True)
+async def analyze_batch_v2_endpoint(request: BatchAnalyzeV2Request):
+    results = await analyze_batch_cached(request)
+    if request.render:
+        results = [r if "error" in r else with_diagramming(r) for r in results]
+    return {"results": results}
+
+
+# ◎ 어휘 사전 교체 (관리자용) : X-Admin-Token 헤더가 ADMIN_TOKEN과 같아야 함
+@app.post("/admin/lexicon")
+async def update_lexicon(request: LexiconUpdateRequest, x_admin_token: str = Header(default="")):
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="forbidden")
+
+    try:
+        if request.lexicons is None:
+            new_lexicon = Lexicon.load(LEXICON_PATH)
+        else:
+            data = lexicon.to_data()
+            data["lexicons"].update(request.lexicons)
+            data["version"] = request.version if request.version is not None else data["version"]
+            new_lexicon = Lexicon(data, source="admin")
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid lexicon: {e}")
+
+    return await asyncio.get_running_loop().run_in_executor(None, swap_lexicon, new_lexicon)
+
+
+# ◎ 서버 상태 확인용 통계 (분석 실행기 대기열 길이, 대기 시간 등)
+@app.get("/stats")
+async def stats():
+    return JSONResponse(content={
+        "executor": analyze_executor.stats(),
+        "microbatch": micro_batcher.stats(),
+        "single_flight": single_flight.stats(),
+        "admission": admission.stats(),
+        "token_cache": token_table_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "parse_cache": doc_store.stats() if doc_store is not None else None,
+        "engine_fingerprint": ENGINE_FINGERPRINT,
+        "token_table_engine": TOKEN_TABLE_ENGINE,
+        "rule_matcher_engine": RULE_MATCHER_ENGINE,
+        "symbol_sets": sorted(symbol_tables),
+        "rule_passes": rule_passes.stats(),
+        "model_routing": model_router.stats(),
+        "pipeline": {"profile": SPACY_PIPELINE_PROFILE, "excluded": SPACY_EXCLUDE, "sort_by_length": PARSE_SORT_BY_LENGTH,
+                     "components": {p.name: p.nlp.pipe_names for p in (accurate_pipeline, fast_pipeline) if p is not None},
+                     "parse_components": entity_pipeline.nlp.pipe_names if entity_pipeline is not None else None},
+        "lexicon": {"version": lexicon.version, "path": lexicon.source,
+                    "words": sum(len(words) for words in lexicon.sets.values()),
+                    "swaps": lexicon_swaps["count"], "last_swap": lexicon_swaps["last"],
+                    "watch_interval": LEXICON_WATCH_INTERVAL, "watch_errors": lexicon_watcher.errors},
+    }, status_code=200)
+
 # ◎ 아래 엔드포인트는 GET /ping 요청에 대해 {"message": "pong"} 응답을 준다.
 @app.get("/ping")
 async def ping():
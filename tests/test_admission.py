@@ -0,0 +1,92 @@
+"""과부하 제어 : 문장 수 기준 대기량, 시간이 지나면 줄어드는 지연, 429"""
+import asyncio
+import contextlib
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import BASELINE
+
+
+@pytest.fixture
+def controller(main):
+    return main.AdmissionController(main.analyze_executor, soft_queue=8, soft_latency_ms=1000,
+                                    hard_queue=32, half_life=10)
+
+
+def test_batch_counts_every_sentence(controller):
+    with controller.tracking(20):
+        assert controller.depth() == 20
+        assert controller.under_pressure()
+    assert controller.depth() == 0
+    assert not controller.under_pressure()
+
+
+def test_hard_limit_rejects_with_retry_after(main, controller):
+    controller.observe(2.5)
+    with controller.tracking(40):
+        with pytest.raises(main.HTTPException) as error:
+            controller.admit()
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "3"
+    assert controller.rejected == 1
+
+
+def test_hard_limit_counts_the_incoming_batch(main, controller):
+    assert controller.admit(100) == "full"  # 비어 있는 서버는 한도보다 큰 배치도 받는다
+    with controller.tracking(31):
+        assert controller.admit(1)
+        with pytest.raises(main.HTTPException) as error:
+            controller.admit(2)
+    assert error.value.status_code == 429
+    assert controller.rejected == 1
+
+
+def test_duplicate_in_flight_sentence_skips_admission(main, monkeypatch):
+    sentence = BASELINE[-1]["sentence"]
+    main.result_cache.clear()
+    monkeypatch.setattr(main.admission, "hard_queue", 1)
+    request = main.AnalyzeRequest(sentence=sentence)
+
+    async def analyze_twice():
+        first = asyncio.ensure_future(main.analyze_cached(request))
+        await asyncio.sleep(0)  # 첫 요청이 admit 후 single-flight 작업을 시작할 때까지
+        assert main.admission.depth() == 1
+        try:
+            second = await main.analyze_cached(request)  # 대기량 1 + 1 > 1 이지만 429 대신 합류
+        finally:
+            result = await first  # 실패해도 배치 작업을 남기지 않도록 끝까지 기다림
+        return result, second
+
+    rejected = main.admission.rejected
+    with contextlib.redirect_stdout(io.StringIO()):
+        first, second = asyncio.run(analyze_twice())
+    assert first == second
+    assert main.admission.rejected == rejected
+    assert main.admission.depth() == 0
+
+
+def test_latency_decays_without_new_samples(controller):
+    controller.observe(4.0)
+    assert controller.under_pressure()
+    controller._latency_at -= 30  # 30초 동안 새 측정 없음 → 반감기 3번
+    assert controller.latency == pytest.approx(0.5, rel=1e-3)
+    assert not controller.under_pressure()
+
+
+def test_endpoint_returns_429_when_saturated(main, monkeypatch):
+    sentence = BASELINE[-1]["sentence"]
+    main.result_cache.clear()
+    monkeypatch.setattr(main.admission, "hard_queue", 4)
+    with contextlib.redirect_stdout(io.StringIO()), TestClient(main.app) as client:
+        with main.admission.tracking(4):
+            response = client.post("/analyze", json={"sentence": sentence})
+            batch = client.post("/analyze/batch", json={"sentences": [sentence]})
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert batch.status_code == 429
+
+        response = client.post("/analyze", json={"sentence": sentence})
+        assert response.status_code == 200
+        assert response.json()["tier"] == "full"
@@ -0,0 +1,60 @@
+"""
+리팩터링 전(AnalysisContext 도입 이전) main.py가 그린 도식과 지금 엔진의 도식 비교.
+fixtures/baseline_diagrams.json : 문장별 파싱 결과(words/pos/tag/lemma/morph/dep/head) + 예전 /analyze 응답의
+diagramming, verb_attribute. 실제 교과서 문장 + 무작위 파싱 트리 문장(규칙 분기 커버용)이 섞여 있다.
+파싱 결과를 그대로 넣으므로 spaCy 모델 없이 규칙/도식 단계만 비교한다.
+"""
+import contextlib
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import BASELINE, fixture_doc
+
+ENGINES = [
+    ("dict", False),
+    ("columnar", False),
+    ("doc", False),
+    ("dict", True),
+    ("columnar", True),
+    ("doc", True),
+]
+
+
+@pytest.mark.parametrize("engine,matcher", ENGINES, ids=[f"{e}-matcher{int(m)}" for e, m in ENGINES])
+def test_diagrams_match_baseline(main, monkeypatch, engine, matcher):
+    monkeypatch.setattr(main, "TOKEN_TABLE_ENGINE", engine)
+    monkeypatch.setattr(main, "RULE_MATCHER_ENGINE", matcher)
+
+    mismatches = []
+    for entry in BASELINE:
+        doc = fixture_doc(main.nlp.vocab, entry)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if engine == "doc":
+                result = main.analyze_sentence(entry["sentence"], doc=doc, use_doc_view=True)
+            else:
+                result = main.analyze_sentence(entry["sentence"], tokens=main.doc_to_tokens(doc), use_doc_view=False)
+        verb_attribute = json.loads(json.dumps(result["verb_attribute"]))  # 응답 JSON과 같은 모양 (symbol_map 키 → str)
+        if (result["diagramming"], verb_attribute) != (entry["diagramming"], entry["verb_attribute"]):
+            mismatches.append(entry["sentence"])
+
+    assert not mismatches, f"{len(mismatches)}/{len(BASELINE)} diagrams changed, e.g. {mismatches[:3]}"
+
+
+def test_analyze_endpoints_match_baseline(main):
+    entries = BASELINE[:40]
+    with contextlib.redirect_stdout(io.StringIO()), TestClient(main.app) as client:
+        for entry in entries:
+            response = client.post("/analyze", json={"sentence": entry["sentence"]})
+            assert response.status_code == 200
+            body = response.json()
+            assert body["diagramming"] == entry["diagramming"], entry["sentence"]
+            assert body["verb_attribute"] == entry["verb_attribute"], entry["sentence"]
+
+            v2 = client.post("/v2/analyze", json={"sentence": entry["sentence"], "render": True}).json()
+            assert v2["diagramming"] == entry["diagramming"], entry["sentence"]
+
+        batch = client.post("/analyze/batch", json={"sentences": [e["sentence"] for e in entries]}).json()
+        assert [r.get("diagramming") for r in batch["results"]] == [e["diagramming"] for e in entries]
@@ -0,0 +1,88 @@
+"""
+combine 계산 복잡도 확인 : 문장 길이를 늘려도 토큰당 작업량이 거의 일정해야 한다 (= 선형).
+spaCy 없이 "He gave me a book on the table and ..." 절을 반복한 가짜 토큰 테이블로 측정한다.
+작업량은 벽시계 시간 대신 토큰 필드 조회 횟수와 children_of 호출 횟수로 센다 (CI 부하와 무관).
+"""
+import contextlib
+import io
+
+CLAUSE = [
+    # (text, pos, dep, role1, head 상대 위치)
+    ("He", "PRON", "nsubj", "subject", 1),
+    ("gave", "VERB", "conj", "verb", None),
+    ("me", "PRON", "dative", "indirect object", 1),
+    ("book", "NOUN", "dobj", "direct object", 1),
+    ("on", "ADP", "prep", "preposition", 1),
+    ("table", "NOUN", "pobj", "prepositional object", 4),
+    ("and", "CCONJ", "cc", None, 1),
+]
+
+
+class CountingToken(dict):
+    """필드 조회(t["x"], t.get("x"))를 공유 카운터에 기록하는 토큰 dict"""
+    def __init__(self, counter: list, **fields):
+        super().__init__(**fields)
+        self.counter = counter
+
+    def __getitem__(self, key):
+        self.counter[0] += 1
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.counter[0] += 1
+        return super().get(key, default)
+
+
+def make_tokens(n_clauses: int, counter: list = None) -> list:
+    tokens = []
+    prev_verb = None
+    for c in range(n_clauses):
+        base = c * len(CLAUSE)
+        verb_idx = base + 1
+        for i, (text, pos, dep, role1, rel) in enumerate(CLAUSE):
+            idx = base + i
+            if rel is None:
+                head_idx = prev_verb if prev_verb is not None else idx
+                dep = dep if prev_verb is not None else "root"
+            elif text == "table":
+                head_idx = base + i - 1
+            else:
+                head_idx = verb_idx
+            fields = {
+                "idx": idx, "text": text, "pos": pos, "tag": "", "dep": dep,
+                "head_idx": head_idx, "role1": role1, "level": 0,
+            }
+            tokens.append(fields if counter is None else CountingToken(counter, **fields))
+        prev_verb = verb_idx
+    return tokens
+
+
+def per_token_work(main, monkeypatch, n_clauses: int) -> float:
+    """guess_combine_second 1번에 든 (필드 조회 + children_of 호출) 횟수 / 토큰 수"""
+    counter = [0]
+    children_of = main.TokenIndex.children_of
+
+    def counting_children_of(self, idx):
+        counter[0] += 1
+        return children_of(self, idx)
+
+    monkeypatch.setattr(main.TokenIndex, "children_of", counting_children_of)
+    tokens = make_tokens(n_clauses, counter)
+    with contextlib.redirect_stdout(io.StringIO()):  # 전치사 DEBUG 출력 숨김
+        main.guess_combine_second(tokens)
+    return counter[0] / (n_clauses * len(CLAUSE))
+
+
+def test_combine_links_every_clause(main):
+    tokens = make_tokens(4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.guess_combine_second(tokens)
+    verbs = [t for t in tokens if t["role1"] == "verb"]
+    assert all(t.get("combine") for t in verbs)
+
+
+def test_combine_scales_linearly(main, monkeypatch):
+    small = per_token_work(main, monkeypatch, 8)
+    large = per_token_work(main, monkeypatch, 512)
+    ratio = large / small
+    assert ratio <= 1.5, f"combine 계산이 선형보다 빠르게 늘어남 (토큰당 작업량 비율 {ratio:.2f})"
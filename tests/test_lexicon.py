@@ -0,0 +1,65 @@
+"""어휘 사전 검증 / 파일 감시 교체"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def lexicon_data(main, **overrides) -> dict:
+    data = main.lexicon.to_data()
+    data["lexicons"].update(overrides)
+    return data
+
+
+@pytest.mark.parametrize("bad", [
+    ["not", "an", "object"],
+    {"version": 2, "lexicons": ["dativeVerbs"]},
+])
+def test_rejects_malformed_top_level(main, bad):
+    with pytest.raises(ValueError):
+        main.Lexicon(bad)
+
+
+@pytest.mark.parametrize("entry", [
+    "due",
+    {"match": "text_lower", "words": "due"},
+    {"match": "text_lower", "words": 5},
+    {"match": "text_lower", "words": ["due", 5]},
+])
+def test_rejects_malformed_entry(main, entry):
+    with pytest.raises(ValueError):
+        main.Lexicon(lexicon_data(main, blacklist_preposition_words=entry))
+
+
+def test_admin_rejects_string_words(main, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/admin/lexicon", headers={"X-Admin-Token": "secret"},
+            json={"lexicons": {"blacklist_preposition_words": {"match": "text_lower", "words": "due"}}},
+        )
+    assert response.status_code == 400
+    assert main.lexicon.words("blacklist_preposition_words") == frozenset({"due", "according"})
+
+
+def test_watcher_survives_malformed_file(main, tmp_path):
+    path = tmp_path / "lexicons.json"
+    path.write_text(json.dumps(lexicon_data(main)), encoding="utf-8")
+    watcher = main.LexiconWatcher(str(path), interval=0)
+    original = main.lexicon
+
+    for bad in (["a", "list"], lexicon_data(main, dativeVerbs="give"), lexicon_data(main, dativeVerbs={"words": 5})):
+        path.write_text(json.dumps(bad) + " " * watcher.errors, encoding="utf-8")  # 크기가 달라야 변경으로 봄
+        assert watcher.check() is None
+    assert watcher.errors == 3
+    assert main.lexicon is original
+
+    data = lexicon_data(main, dativeVerbs={"match": "lemma", "words": ["give", "hand"]})
+    data["version"] = 99
+    path.write_text(json.dumps(data), encoding="utf-8")
+    try:
+        summary = watcher.check()
+        assert summary["version"] == 99
+        assert main.lexicon.words("dativeVerbs") == frozenset({"give", "hand"})
+    finally:
+        main.swap_lexicon(original)
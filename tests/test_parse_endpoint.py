@@ -0,0 +1,34 @@
+"""/parse : 규칙 프로필(NER 제외)에서도 ent_type을 채우는 파이프라인으로 파싱"""
+from fastapi.testclient import TestClient
+
+from conftest import BASELINE
+
+
+def test_parse_loads_entity_pipeline_once(main, monkeypatch):
+    loads = []
+    load_spacy_model = main.load_spacy_model
+
+    def recording_load(name, **kwargs):
+        loads.append(kwargs.get("exclude"))
+        return load_spacy_model(name, **kwargs)
+
+    monkeypatch.setattr(main, "load_spacy_model", recording_load)
+    monkeypatch.setattr(main, "entity_pipeline", None)
+    sentence = BASELINE[0]["sentence"]
+    with TestClient(main.app) as client:
+        responses = [client.post("/parse", json={"text": sentence}) for _ in range(2)]
+
+    assert "ner" in main.SPACY_EXCLUDE
+    assert loads == [[name for name in main.SPACY_EXCLUDE if name != "ner"]]
+    for response in responses:
+        assert response.status_code == 200
+        tokens = response.json()["result"]
+        assert [t["dep"] for t in tokens] == BASELINE[0]["dep"]
+        assert all("ent_type" in t for t in tokens)
+
+
+def test_parse_uses_main_pipeline_when_ner_is_kept(main, monkeypatch):
+    monkeypatch.setattr(main, "SPACY_EXCLUDE", [])
+    monkeypatch.setattr(main, "entity_pipeline", None)
+    assert main.get_entity_pipeline() is main.accurate_pipeline
+    assert main.entity_pipeline is None